@@ -1,9 +1,47 @@
+"""
+Builds the website
+
+    from app import create_app
+    app = create_app()
+
+create_app() makes the Flask app and registers the pages. Scripts that
+only need the database and the email queue (reminders.py, test.py, ...)
+should call create_app(views=False), so the pages, the forms and the
+libraries only they use are never imported. Libraries that only a page
+or two need (BeautifulSoup, Pillow, Flask-Mail) are imported the first
+time they're used rather than up front.
+"""
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+from .database import TunedSQLAlchemy
+
+db = TunedSQLAlchemy()
+
+def create_app(config='config', views=True):
+    app = Flask(__name__)
+    app.config.from_object(config)
+
+    db.init_app(app)
+
+    from .cache import user_cache
+    user_cache.init_app(app)
+
+    from .metrics import request_metrics
+    request_metrics.init_app(app)
+
+    # models has to be imported for the tables to exist
+    from . import models
 
-app = Flask(__name__)
-app.config.from_object('config')
+    if views:
+        from .views import main
+        from .assets import assets
+        from .httpcache import response_cache
+        from .profiler import profiler
+        from .photos import warn_without_pillow
 
-db = SQLAlchemy(app)
+        app.register_blueprint(main)
+        app.register_blueprint(assets)
+        response_cache.init_app(app)
+        profiler.init_app(app)
+        warn_without_pillow(app)
 
-from app import views, models
+    return app
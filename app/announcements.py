@@ -0,0 +1,101 @@
+"""
+The announcements tab on the homepage
+
+Every time a webmaster posts announcements, they're sanitized once and
+saved as a new Announcement row, so the newest row is what's up now and
+the older ones are the history.
+
+current_announcements() keeps the newest version's html in memory. It
+throws it away as soon as this process posts something new, and every
+ANNOUNCEMENTS_TTL seconds it checks (with one tiny query) whether
+another process has. That goes for there being no announcements yet too.
+"""
+
+from app import db
+from flask import current_app
+from .models import Announcement
+import os
+import threading
+import time
+
+VALID_TAGS = ['p', 'ul', 'li', 'br', 'a', 'b', 'i', 'ol', 'u', 'div']
+
+_current = {'version': None, 'html': None, 'posted_at': None, 'checked_at': 0}
+_lock = threading.Lock()
+
+def sanitize_announcements(html):
+    """
+    Take some html input and keep only safe tags
+    """
+    # Only needed when somebody posts, so don't load it with everything else
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, "html.parser")
+
+    for tag in soup.findAll(True):
+        if tag.name not in VALID_TAGS:
+            tag.hidden = True
+
+    return soup.renderContents().decode('utf-8')
+
+def post_announcements(html, author):
+    """
+    Sanitize :html: and make it the new version of the announcements
+    """
+    announcement = Announcement.create(sanitize_announcements(html), author)
+
+    with _lock:
+        _current['version'] = announcement.id
+        _current['html'] = announcement.html
+        _current['posted_at'] = announcement.posted_at
+        _current['checked_at'] = time.time()
+
+    return announcement
+
+def current_announcements():
+    """
+    Return the (already sanitized) html of the newest announcements,
+    or None if there aren't any
+    """
+    ttl = current_app.config.get('ANNOUNCEMENTS_TTL', 30)
+
+    # Having no announcements at all gets remembered the same way
+    with _lock:
+        if _current['checked_at'] + ttl > time.time():
+            return _current['html']
+
+    latest = db.session.query(db.func.max(Announcement.id)).scalar()
+    if latest is None:
+        latest = _import_old_announcements()
+
+    with _lock:
+        if latest != _current['version']:
+            announcement = Announcement.query.get(latest) if latest is not None else None
+            _current['version'] = latest
+            _current['html'] = announcement.html if announcement else None
+            _current['posted_at'] = announcement.posted_at if announcement else None
+        _current['checked_at'] = time.time()
+
+        return _current['html']
+
+def announcements_version():
+    """
+    Return (id, time posted) of the announcements currently being shown
+    """
+    current_announcements()
+    return _current['version'], _current['posted_at']
+
+def _import_old_announcements():
+    """
+    Announcements used to live in static/txts/announcements.txt.
+    If the table is empty, bring those over as the first version.
+    """
+    path = os.path.join(os.getcwd(), "app", "static", "txts", "announcements.txt")
+
+    try:
+        with open(path) as old_file:
+            html = old_file.read().decode('utf-8')
+    except IOError:
+        return None
+
+    return Announcement.create(sanitize_announcements(html), None).id
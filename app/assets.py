@@ -0,0 +1,132 @@
+"""
+Serves the site's css, javascript and images under fingerprinted names
+
+build_assets.py bundles the files listed in BUNDLES (compiling the sass
+and minifying as it goes) and copies the images, giving every output a
+name containing a hash of its contents, e.g. site.3f2a9c1b7e44.css.
+It also writes .gz (and, if the brotli module is installed, .br) copies
+and a manifest.json mapping the plain names to the hashed ones, all in
+static/dist/.
+
+Since a hashed file can never change, /assets/ sends them with a
+far-future Cache-Control (ASSETS_MAX_AGE), picking the precompressed
+copy the browser can handle.
+
+In templates:
+
+* asset_tags('site.css') writes the <link>/<script> tags for a bundle
+* asset_url('images/sns_logo.png') works like url_for('static', filename=...)
+
+If the assets haven't been built, both fall back to the plain files in
+static/, so a development checkout works without the build step.
+"""
+
+from .cache import content_cache
+from flask import Blueprint, current_app, request, send_file, url_for, abort, safe_join
+from jinja2 import Markup
+import json
+import mimetypes
+import os
+
+# The files that go into each bundle, relative to static/, in order
+BUNDLES = {
+    'site.css': ['sass/main.scss', 'slick/slick.css', 'slick/slick-theme.css'],
+    'site.js': ['js/jquery-3.0.0.min.js', 'js/jquery-migrate-1.2.1.js', 'js/linkSelect.js'],
+    'home.js': ['slick/slick.min.js', 'js/slideshow.js'],
+    'members.js': ['js/members.js'],
+}
+
+# Folders under static/ whose files get fingerprinted one by one.
+# The homepage photos change at runtime, so they aren't in here.
+FINGERPRINTED_DIRS = ['images']
+UNFINGERPRINTED_DIRS = ['images/homepage']
+
+assets = Blueprint('assets', __name__)
+
+def dist_dir():
+    return os.path.join(current_app.static_folder, 'dist')
+
+def manifest_path():
+    return os.path.join(dist_dir(), 'manifest.json')
+
+def _load_manifest(path):
+    try:
+        with open(path) as manifest_file:
+            return json.load(manifest_file)
+    except (IOError, ValueError):
+        return {}
+
+def manifest():
+    """
+    Return the {plain name: hashed name} map, re-reading it only when it changes
+    """
+    return content_cache.get(manifest_path(), _load_manifest)
+
+def source_file(name):
+    """
+    The file a browser should load for :name: when nothing has been built.
+    Sass gets served as the css compiled next to it.
+    """
+    if name.endswith('.scss'):
+        return name[:-len('.scss')] + '.css'
+    return name
+
+@assets.app_template_global()
+def asset_url(filename):
+    """
+    Return the url of a static file, fingerprinted if it has been built
+    """
+    hashed = manifest().get(filename)
+    if hashed is None:
+        return url_for('static', filename=filename)
+
+    return url_for('assets.asset', filename=hashed)
+
+@assets.app_template_global()
+def asset_tags(bundle):
+    """
+    Return the html to load a bundle: one tag if it has been built,
+    otherwise one tag per file in it
+    """
+    hashed = manifest().get(bundle)
+    if hashed is not None:
+        urls = [url_for('assets.asset', filename=hashed)]
+    else:
+        urls = [url_for('static', filename=source_file(name)) for name in BUNDLES[bundle]]
+
+    if bundle.endswith('.css'):
+        tag = '<link rel="stylesheet" type="text/css" href="{0}">'
+    else:
+        tag = '<script type="text/javascript" src="{0}"></script>'
+
+    return Markup("\n".join(tag.format(Markup.escape(url)) for url in urls))
+
+@assets.route('/assets/<path:filename>')
+def asset(filename):
+    """
+    Send a fingerprinted file, precompressed if the browser accepts it
+    """
+    # Files from older builds are kept, since cached pages may still ask for them
+    path = safe_join(dist_dir(), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    accepted = request.accept_encodings
+
+    encoding = None
+    for candidate, extension in [('br', '.br'), ('gzip', '.gz')]:
+        if accepted[candidate] and os.path.isfile(path + extension):
+            encoding = candidate
+            path += extension
+            break
+
+    response = send_file(path, mimetype=mimetype, conditional=True,
+            cache_timeout=current_app.config.get('ASSETS_MAX_AGE', 31536000))
+
+    response.cache_control.public = True
+    response.vary.add('Accept-Encoding')
+    if encoding is not None:
+        response.content_encoding = encoding
+
+    return response
@@ -0,0 +1,126 @@
+"""
+Works out which shows are holding auditions, and which slots are still open
+
+Rather than asking the database about every single slot, we grab every
+booked slot for the show in one query, keep them in a set, and check
+each slot of each audition block against that set.
+
+Which shows have auditions coming up is kept in open_shows, a small
+cached index that make_audition_times refreshes when it adds a block.
+"""
+
+from app import db
+from flask import current_app
+from .models import PossibleAuditionTimes, AuditionTimes, slot_time
+import datetime
+import threading
+import time
+
+class OpenShows(object):
+    """
+    Remembers which shows still have audition blocks coming up
+
+    For each show we keep the date of its last audition block; the show
+    stays open until that date has passed. So the index only needs
+    rebuilding when a block gets added (call invalidate), or every
+    OPEN_SHOWS_TTL seconds to pick up blocks added by other processes.
+    """
+    def __init__(self):
+        self._last_dates = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def shows(self):
+        """
+        Return a sorted list of the shows with auditions still to come
+        """
+        now = datetime.datetime.today()
+        ttl = current_app.config.get('OPEN_SHOWS_TTL', 60)
+
+        with self._lock:
+            if self._last_dates is None or self._loaded_at + ttl < time.time():
+                self._last_dates = dict(db.session.query(PossibleAuditionTimes.show,
+                        db.func.max(PossibleAuditionTimes.date))
+                        .filter(PossibleAuditionTimes.date > now)
+                        .group_by(PossibleAuditionTimes.show))
+                self._loaded_at = time.time()
+
+            last_dates = self._last_dates
+
+        return sorted(show for show, last in last_dates.items() if last > now)
+
+    def invalidate(self):
+        with self._lock:
+            self._last_dates = None
+
+open_shows = OpenShows()
+
+def upcoming_blocks(show):
+    """
+    Return the audition blocks for :show: that haven't happened yet, in order
+    """
+    return PossibleAuditionTimes.query.filter_by(show=show)\
+            .filter(PossibleAuditionTimes.date > datetime.datetime.today())\
+            .order_by(PossibleAuditionTimes.date, PossibleAuditionTimes.start_time).all()
+
+def taken_slots(show):
+    """
+    Return the set of slot times (datetimes, to the minute) that somebody
+    has already signed up for
+
+    This only needs the (show, time) index, never the table itself.
+    """
+    booked = db.session.query(AuditionTimes.time).filter_by(show=show)
+
+    return set(time for (time,) in booked)
+
+def block_day(block):
+    """
+    Return the day an audition block is on, as a date
+    """
+    if isinstance(block.date, datetime.datetime):
+        return block.date.date()
+    return block.date
+
+def free_slots(block, taken):
+    """
+    Return a list of "HH:MM" strings for every slot in an audition block
+    that isn't in :taken:
+
+    Bookings are stored on the block's date at the slot's time of day
+    (that's what the signup form sends back), and start_time's own date
+    can be a different day, so that's what we look slots up by.
+    """
+    day = block_day(block)
+
+    free = []
+    current_start = block.start_time
+    while current_start <= block.end_time:
+        # If somebody else doesn't have the timeslot
+        if slot_time(datetime.datetime.combine(day, current_start.time())) not in taken:
+            free.append(current_start.strftime("%H:%M"))
+
+        current_start += block.audition_length
+
+    return free
+
+def available_auditions(show, blocks):
+    """
+    Expand the audition blocks for a show into a list of (day, "HH:MM")
+    pairs that can still be signed up for.
+
+    This costs one query no matter how many blocks or slots there are.
+    """
+    return expand_blocks(blocks, taken_slots(show))
+
+def expand_blocks(blocks, taken=frozenset()):
+    """
+    Expand audition blocks into a list of (day, "HH:MM") pairs, leaving
+    out the slots in :taken:
+    """
+    slots = []
+    for block in blocks:
+        day = block.date.strftime("%A %B %d %Y")
+        slots += [(day, time) for time in free_slots(block, taken)]
+
+    return slots
@@ -0,0 +1,40 @@
+"""
+A thread that does work in the background for the app, one per process
+
+The outbox sender and the photo resizer are each one of these. They're
+started the first time there's something for them to do, rather than at
+startup, so scripts and workers that never send email or take uploads
+never run them.
+
+Threads don't survive a fork, so a worker forked by serve.py after the
+master started one would be left without it. ensure_running() notices
+(the thread belongs to another pid, or has died) and starts a new one.
+"""
+
+from flask import current_app
+import os
+import threading
+
+class BackgroundThread(object):
+    """
+    Runs :target:(app) on a daemon thread called :name:, started on demand
+    """
+    def __init__(self, name, target):
+        self.name = name
+        self.target = target
+
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_running(self):
+        """
+        Start the thread for the current app, unless this process already has it
+        """
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                app = current_app._get_current_object()
+                self._thread = threading.Thread(target=self.target, args=(app,), name=self.name)
+                self._thread.daemon = True
+                self._thread.start()
+                self._pid = os.getpid()
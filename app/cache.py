@@ -0,0 +1,261 @@
+"""
+In-process caches that save us trips to the database and the disk
+
+LRUCache: a small thread-safe least-recently-used cache whose entries
+  can also expire after a number of seconds.
+
+IdentityCache: remembers who a user is and what they're allowed to do
+  (id, name, email, user_level) across requests, keyed by user id.
+  Anything that saves a User through QueryMixin forgets that user again,
+  in every worker (see USER_CACHE_STAMP in config.py).
+
+FileCache: keeps things read off the disk (text files, directory listings)
+  in memory until the file or directory changes.
+"""
+
+from flask import current_app
+from collections import OrderedDict, namedtuple
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+class LRUCache(object):
+    """
+    A bounded mapping that throws away the least recently used entries
+
+    If :ttl: is given, entries older than :ttl: seconds are treated as missing.
+    """
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires < time.time():
+                self.misses += 1
+                return default
+
+            # Move the key back to the most recently used end
+            self._data[key] = (value, expires)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else None
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+# Everything we need to know about a user to draw a page or check a role
+Identity = namedtuple('Identity', ['id', 'name', 'email', 'user_level'])
+
+class IdentityCache(object):
+    """
+    Remember the identity and role of recently seen users
+
+    Users are stored by id. Since the session only knows the user's email,
+    we also keep a map of email -> id next to it.
+
+    Every worker has its own copy, so when a user changes, the worker that
+    changed them rewrites the :stamp: file. The others check it (one
+    os.stat) on every lookup, and throw everything away once it's changed.
+
+    Set USER_CACHE_ENABLED = False in config.py to turn this off.
+    """
+    def __init__(self, maxsize=1024, ttl=60, enabled=True, stamp=None):
+        self._users = LRUCache(maxsize, ttl)
+        self._ids = LRUCache(maxsize, ttl)
+        self.enabled = enabled
+
+        self.stamp = stamp
+        self._stamp_seen = None
+
+    def init_app(self, app):
+        """
+        Size (or turn off) the cache with the USER_CACHE_* settings of :app:
+        """
+        self.__init__(app.config.get('USER_CACHE_SIZE', 1024),
+                      app.config.get('USER_CACHE_TTL', 60),
+                      app.config.get('USER_CACHE_ENABLED', True),
+                      app.config.get('USER_CACHE_STAMP'))
+
+    def lookup(self, email):
+        """
+        Return the Identity of the user with this email, or None if we don't know it
+        """
+        if not self.enabled:
+            return None
+
+        self._check_stamp()
+
+        user_id = self._ids.get(email)
+        if user_id is None:
+            return None
+
+        identity = self._users.get(user_id)
+
+        # The user changed their email since we last saw them
+        if identity is None or identity.email != email:
+            return None
+
+        return identity
+
+    def remember(self, user):
+        """
+        Cache (and return) the Identity of a User from the database
+        """
+        identity = Identity(user.id, user.name, user.email, user.user_level)
+
+        if self.enabled:
+            self._users.set(identity.id, identity)
+            self._ids.set(identity.email, identity.id)
+
+        return identity
+
+    def forget(self, user_id):
+        """
+        Drop a user from the cache, e.g. because they were just changed,
+        and tell the other workers to do the same
+        """
+        identity = self._users.pop(user_id)
+        if identity is not None:
+            self._ids.pop(identity.email)
+
+        self._touch_stamp()
+
+    def forget_all(self):
+        """
+        Empty the cache, and tell the other workers to do the same
+        """
+        self.clear()
+        self._touch_stamp()
+
+    def clear(self):
+        self._users.clear()
+        self._ids.clear()
+
+    def _check_stamp(self):
+        """
+        Empty the cache if another worker has changed a user since we last looked
+        """
+        if not self.stamp:
+            return
+
+        seen = _stamps.get(self.stamp, _read_stamp)
+        if seen != self._stamp_seen:
+            self.clear()
+            self._stamp_seen = seen
+
+    def _touch_stamp(self):
+        """
+        Give the stamp file a new value, all at once so no worker reads half of it
+        """
+        if not (self.enabled and self.stamp):
+            return
+
+        try:
+            directory = os.path.dirname(self.stamp)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+            fd, temp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as stamp_file:
+                stamp_file.write(uuid.uuid4().hex)
+            os.rename(temp_path, self.stamp)
+        except (IOError, OSError):
+            # Then the other workers only find out after USER_CACHE_TTL
+            current_app.logger.exception("Couldn't tell the other workers a user changed")
+
+    def stats(self):
+        return self._users.stats()
+
+def _read_stamp(path):
+    try:
+        with open(path) as stamp_file:
+            return stamp_file.read()
+    except IOError:
+        return None
+
+user_cache = IdentityCache()
+
+class FileCache(object):
+    """
+    Remember what we loaded from a path until the path changes on disk
+
+    Checking for changes costs a single os.stat. For a directory, the
+    modification time changes whenever a file is added, removed or renamed,
+    so this works for directory listings too.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path, load):
+        """
+        Return load(path), reusing the last result if :path: hasn't changed since
+        """
+        try:
+            stat = os.stat(path)
+            version = (stat.st_mtime, stat.st_size)
+        except OSError:
+            version = None
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = load(path)
+
+        with self._lock:
+            self._entries[path] = (version, value)
+
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+content_cache = FileCache()
+
+# The user cache's stamp file, re-read whenever it changes
+_stamps = FileCache()
@@ -0,0 +1,154 @@
+"""
+Sets up the database connections
+
+Out of the box sqlite lets nobody read while somebody writes, so with a
+few worker processes people start seeing "database is locked". For sqlite
+databases, every new connection gets:
+
+* journal_mode=WAL, so reads and a write can happen at the same time,
+* synchronous=NORMAL, which is still safe with WAL but fsyncs far less,
+* busy_timeout, so a writer waits for the lock instead of failing,
+* cache_size, the page cache each connection keeps.
+
+(See the SQLITE_* settings in config.py.) Each process also keeps a pool
+of open connections (SQLALCHEMY_POOL_SIZE) rather than opening a new one
+for every request.
+
+Routes decorated with @read_only do their reading over a second set of
+connections (the 'read' engine), so they never queue up behind requests
+that write. That engine connects to SQLALCHEMY_READ_DATABASE_URI if it's
+set (e.g. a replica), otherwise to the main database, and for sqlite its
+connections are query_only. Anything flushed from a read only route still
+goes to the main database.
+
+Other databases still get the pool settings and the read engine; only
+the pragmas are sqlite specific.
+"""
+
+from flask import g, request, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, _EngineConnector
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from functools import wraps
+
+READ = 'read'
+
+def read_only(func):
+    """
+    Decorator for routes that only read from the database (when they're GETs)
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        g.read_only = request.method in ('GET', 'HEAD')
+        return func(*args, **kwargs)
+    return wrapper
+
+def is_sqlite(url):
+    return url.drivername.startswith('sqlite')
+
+def in_memory(url):
+    return is_sqlite(url) and url.database in (None, '', ':memory:')
+
+class RoutingSession(SignallingSession):
+    """
+    Sends the reads of @read_only routes to the read engine
+    """
+    def __init__(self, db, **options):
+        self.db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and has_app_context() and g.get('read_only'):
+            engine = self.db.read_engine(self.app)
+            if engine is not None:
+                return engine
+
+        return SignallingSession.get_bind(self, mapper, clause)
+
+class TunedEngineConnector(_EngineConnector):
+    """
+    Knows where the read engine connects, and sets the sqlite pragmas on
+    every connection its engine makes
+    """
+    def get_uri(self):
+        if self._bind == READ:
+            config = self._app.config
+            return config.get('SQLALCHEMY_READ_DATABASE_URI') or config['SQLALCHEMY_DATABASE_URI']
+
+        return _EngineConnector.get_uri(self)
+
+    def get_engine(self):
+        engine = _EngineConnector.get_engine(self)
+
+        # Flask-SQLAlchemy hands back the same engine until the uri changes
+        if engine is not getattr(self, '_tuned_engine', None):
+            if is_sqlite(engine.url) and not in_memory(engine.url):
+                event.listen(engine, 'connect', self._sqlite_pragmas)
+            self._tuned_engine = engine
+
+        return engine
+
+    def _sqlite_pragmas(self, connection, record):
+        config = self._app.config
+        pragmas = [
+            ('journal_mode', config.get('SQLITE_JOURNAL_MODE')),
+            ('synchronous', config.get('SQLITE_SYNCHRONOUS')),
+            ('busy_timeout', config.get('SQLITE_BUSY_TIMEOUT')),
+            ('cache_size', config.get('SQLITE_CACHE_SIZE')),
+        ]
+        if self._bind == READ:
+            pragmas.append(('query_only', 'ON'))
+
+        cursor = connection.cursor()
+        for (name, value) in pragmas:
+            if value is not None:
+                cursor.execute("PRAGMA {0} = {1}".format(name, value))
+        cursor.close()
+
+class TunedSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy, with the pooling, pragmas and read engine described above
+    """
+    def create_session(self, options):
+        return RoutingSession(self, **options)
+
+    def make_connector(self, app, bind=None):
+        return TunedEngineConnector(self, app, bind)
+
+    def apply_driver_hacks(self, app, info, options):
+        SQLAlchemy.apply_driver_hacks(self, app, info, options)
+
+        if in_memory(info):
+            # An in-memory database only ever has the one connection
+            for option in ('pool_size', 'pool_timeout', 'max_overflow'):
+                options.pop(option, None)
+
+        elif is_sqlite(info) and options.get('pool_size'):
+            # Flask-SQLAlchemy only pools sqlite files if a pool size is set,
+            # and then sqlalchemy would pick a pool that ignores it
+            options['poolclass'] = QueuePool
+
+            # The pool makes sure only one thread uses a connection at a time
+            options.setdefault('connect_args', {})['check_same_thread'] = False
+
+    def read_engine(self, app):
+        """
+        Return the engine for read only routes, or None if they should
+        just use the main one
+        """
+        uri = app.config.get('SQLALCHEMY_READ_DATABASE_URI') or app.config['SQLALCHEMY_DATABASE_URI']
+
+        # A second connection to an in-memory database would see a different database
+        if in_memory(make_url(uri)):
+            return None
+
+        return self.get_engine(app, bind=READ)
+
+    def dispose_engines(self, app):
+        """
+        Close every pooled connection (e.g. before forking, since processes
+        mustn't share sqlite connections)
+        """
+        for connector in app.extensions['sqlalchemy'].connectors.values():
+            connector.get_engine().dispose()
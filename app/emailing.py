@@ -1,15 +1,19 @@
 """
 Allow the website to send emails to its users
+
+Emails are only queued here; outbox.py sends them in the background.
+
+send_audition_reminders is the daily reminder job (see reminders.py).
 """
-from flask_mail import Message
-from .models import User
+from app import db
+from flask import current_app
+from . import outbox
+from .models import QueryMixin, AuditionTimes, AuditionReminder, OutgoingEmail
 import config
+import datetime
 
 def send_email(subject, sender, recipients, body):
-    msg = Message(subject, sender=sender, recipients=recipients)
-    msg.body = body
-
-    mail.send(msg)
+    outbox.enqueue(subject, sender, recipients, body)
 
 def welcome_notification(user):
     subject = "Welcome to the S'n'Website!!"
@@ -22,12 +26,47 @@ def welcome_notification(user):
     send_email(subject, config.MAIL_ADDRESS, [user.email], body)
 
 def audition_reminder(audition):
-    subject = "Remember: You have an audition for {0} today!".format(audition.show)
+    send_email(*reminder_email(audition))
+
+def reminder_email(audition):
+    """
+    Return the (subject, sender, recipients, body) of the reminder for an audition
+    """
+    subject = u"Remember: You have an audition for {0} today!".format(audition.show)
 
     # :time: is of the form "Day date HH:MM"
-    body = "Friendly reminder that you have an audition for {show}!!!\n {time}!".format(
+    body = u"Friendly reminder that you have an audition for {show}!!!\n {time}!".format(
             show=audition.show, time=audition.time_str)
 
-    user = User.query.filter_by(id=audition.user_id).first()
+    return (subject, config.MAIL_ADDRESS, [audition.user.email], body)
 
-    send_email(subject, config.MAIL_ADDRESS, [user.email], body)
+def send_audition_reminders(day):
+    """
+    Remind everybody auditioning on :day: who hasn't been reminded yet
+
+    The auditions (and their auditioners) come out of one query. All the
+    reminder emails, along with the record that they were sent, are
+    inserted in one transaction, so running this twice never sends
+    anything twice. Then they all go out over one SMTP connection.
+
+    Returns (number of reminders queued, number of emails sent)
+    """
+    start = datetime.datetime.combine(day, datetime.time())
+    end = start + datetime.timedelta(days=1)
+
+    reminded = db.and_(AuditionReminder.user_id == AuditionTimes.user_id,
+                       AuditionReminder.show == AuditionTimes.show,
+                       AuditionReminder.time == AuditionTimes.time)
+
+    auditions = AuditionTimes.query.outerjoin(AuditionReminder, reminded)\
+            .filter(AuditionReminder.id == None)\
+            .filter(AuditionTimes.time >= start, AuditionTimes.time < end).all()
+
+    if auditions:
+        with QueryMixin.batch():
+            OutgoingEmail.bulk_create(reminder_email(a) for a in auditions)
+            AuditionReminder.bulk_create((a,) for a in auditions)
+
+    sent = outbox.drain(limit=len(auditions) + current_app.config['MAIL_OUTBOX_BATCH'])
+
+    return len(auditions), sent
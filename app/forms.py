@@ -8,18 +8,20 @@ of their information is handled in views.py
 from flask_wtf import Form
 
 from wtforms import (StringField, BooleanField, PasswordField, SubmitField, 
-RadioField, SelectMultipleField, widgets, SelectField, DateField, FileField, TextAreaField)
+RadioField, SelectField, Field, DateField, FileField, TextAreaField)
 
 from wtforms.validators import DataRequired, Email, EqualTo
 from .models import User 
 import datetime
 
-class MultiCheckboxField(SelectMultipleField):
+class ListField(Field):
     """
-    Allow people to tick multiple checkboxes
+    Every value sent under this field's name, as a list
+
+    These aren't drawn by WTForms, the template writes the inputs itself.
     """
-    widget = widgets.ListWidget(prefix_label=False)
-    option_widget = widgets.CheckboxInput()
+    def process_formdata(self, valuelist):
+        self.data = valuelist
 
 class LoginForm(Form):
     """
@@ -79,37 +81,29 @@ class SignUpForm(Form):
         else:
             return True
 
-class ChooseAdminsForm(Form):
-    """
-    See a list of checkboxes to determine who is an admin
+class ChangeLevelForm(Form):
     """
-    admins = MultiCheckboxField('admins')
-    submit = SubmitField('adminify!')
-
-    def __init__(self, *args, **kwargs):
-        Form.__init__(self, *args, **kwargs)
+    Who gained or lost admin (or webmaster) on one page of /adminify (or /webmasterify)
 
-    def validate(self):
-        """
-        This is what we in the biz call a shitty shitty hack
-        """
-        return True
-
-class ChooseWebmasterForm(Form):
+    Only the changes are sent: members.js turns the boxes that were ticked
+    or unticked into grant and revoke when the form is submitted. Without
+    javascript, the ticked boxes (member) and everybody who was on the
+    page (shown) are sent instead, and changes() works it out from those.
     """
-    See a list of checkboxes to determine who is a webmaster
-    """
-    masters = MultiCheckboxField('masters')
-    submit = SubmitField('make webmaster')
-
-    def __init__(self, *args, **kwargs):
-        Form.__init__(self, *args, **kwargs)
+    grant = ListField()
+    revoke = ListField()
+    member = ListField()
+    shown = ListField()
+    submit = SubmitField('save')
 
-    def validate(self):
+    def changes(self):
         """
-        This is what we in the biz call a shitty shitty hack
+        Return the emails to (grant, revoke)
         """
-        return True
+        shown = set(self.shown.data or ())
+        ticked = set(self.member.data or ()) & shown
+
+        return set(self.grant.data or ()) | ticked, set(self.revoke.data or ()) | (shown - ticked)
 
 class CreateAuditionTimesForm(Form):
     """
@@ -214,3 +208,14 @@ class AnnouncementsForm(Form):
 
     def __init__(self, *args, **kwargs):
         Form.__init__(self, *args, **kwargs)
+
+class UploadPhotoForm(Form):
+    """
+    Add a photo to the homepage slideshow
+    """
+
+    photo = FileField('photo', validators=[DataRequired("Please choose a photo.")])
+    submit = SubmitField("Upload")
+
+    def __init__(self, *args, **kwargs):
+        Form.__init__(self, *args, **kwargs)
@@ -0,0 +1,244 @@
+"""
+Lets browsers (and proxies) cache the public pages
+
+@conditional works out an ETag and a Last-Modified date for a page from
+everything the page is drawn from, *before* drawing it:
+
+* the page's templates (plus base.html) and the asset manifest,
+* the content it shows (text files, photos, announcements), and
+* who is logged in, since the top bar changes with the user.
+
+If the browser already has that version, it gets a bare 304 and we skip
+rendering entirely. Otherwise the page is rendered as usual and sent
+along with the validators and a Cache-Control header.
+
+Cache-Control is set per route with HTTP_CACHE_CONTROL in config.py.
+Pages for logged in users are always marked private.
+
+Visitors who aren't logged in all see the same page, so for them we also
+keep the rendered page in response_cache, keyed by path. Each cached page
+remembers the ETag it was rendered for, so it's thrown out by itself as
+soon as a template, the announcements or the txt/photo content changes.
+RESPONSE_CACHE in config.py picks where it's kept: 'memory' (per process),
+'disk' (shared by every process on the machine) or None to turn it off.
+"""
+
+from .cache import LRUCache
+from .assets import manifest_path
+from flask import current_app, request, session
+from functools import wraps
+from datetime import datetime
+import cPickle as pickle
+import hashlib
+import os
+import tempfile
+import threading
+
+def file_version(path):
+    """
+    Return a (token, last modified) validator for a file or directory
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return (path, None)
+
+    return ("{0}@{1!r}".format(path, mtime), datetime.utcfromtimestamp(mtime))
+
+def template_version(name):
+    return file_version(os.path.join(current_app.root_path, current_app.template_folder, name))
+
+def page_validators(templates, content=None, user=None):
+    """
+    Return the (ETag, Last-Modified) for a page drawn from :templates:,
+    showing whatever the :content: function returns validators for, to :user:
+    """
+    validators = [template_version(name) for name in ['base.html'] + list(templates)]
+
+    # Rebuilding the assets changes the urls the page links to
+    validators.append(file_version(manifest_path()))
+
+    if content is not None:
+        validators += content()
+
+    tokens = [str(token) for (token, modified) in validators]
+    if user is not None:
+        tokens.append(repr(tuple(user)))
+
+    etag = hashlib.md5("\n".join(tokens)).hexdigest()
+
+    modified = [m for (token, m) in validators if m is not None]
+    last_modified = max(modified).replace(microsecond=0) if modified else None
+
+    return etag, last_modified
+
+def not_modified(etag, last_modified):
+    """
+    Does the browser already have this version of the page?
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+
+    if request.if_modified_since and last_modified:
+        return request.if_modified_since >= last_modified
+
+    return False
+
+def cache_control(endpoint, logged_in):
+    """
+    Return the Cache-Control header for a route
+    """
+    policies = current_app.config.get('HTTP_CACHE_CONTROL', {})
+    policy = policies.get(endpoint, current_app.config.get('HTTP_CACHE_CONTROL_DEFAULT', 'no-cache'))
+
+    if logged_in:
+        # Shared caches mustn't hand one user's top bar to someone else
+        policy = ", ".join(['private'] + [p.strip() for p in policy.split(',') if p.strip() != 'public'])
+
+    return policy
+
+class MemoryBackend(object):
+    """
+    Keeps cached pages in this process's memory
+    """
+    def __init__(self, maxsize):
+        self._pages = LRUCache(maxsize)
+
+    def get(self, key):
+        return self._pages.get(key)
+
+    def set(self, key, value):
+        self._pages.set(key, value)
+
+    def clear(self):
+        self._pages.clear()
+
+class DiskBackend(object):
+    """
+    Keeps cached pages as files in a directory, one file per path
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _filename(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._filename(key), 'rb') as page_file:
+                return pickle.load(page_file)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        # Write to a temporary file and rename it into place, so another
+        # process never reads half a page
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as page_file:
+            pickle.dump(value, page_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temp_path, self._filename(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+class ResponseCache(object):
+    """
+    Rendered public pages for visitors who aren't logged in
+    """
+    def __init__(self, backend=None):
+        self.backend = backend
+
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, key, etag):
+        """
+        Return the cached response for :key: if it was rendered for :etag:, else None
+        """
+        page = self.backend.get(key) if self.backend else None
+
+        with self._lock:
+            if page is None or page[0] != etag:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        return current_app.response_class(page[1], mimetype=page[2])
+
+    def store(self, key, etag, response):
+        if self.backend:
+            self.backend.set(key, (etag, response.get_data(), response.mimetype))
+
+    def clear(self):
+        if self.backend:
+            self.backend.clear()
+
+    def init_app(self, app):
+        """
+        Keep the pages where RESPONSE_CACHE in :app:'s config says to
+        """
+        kind = app.config.get('RESPONSE_CACHE', 'memory')
+
+        if kind == 'memory':
+            self.backend = MemoryBackend(app.config.get('RESPONSE_CACHE_SIZE', 64))
+        elif kind == 'disk':
+            self.backend = DiskBackend(app.config['RESPONSE_CACHE_DIR'])
+        else:
+            self.backend = None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        ratio = float(self.hits) / lookups if lookups else 0.0
+
+        return {'hits': self.hits, 'misses': self.misses, 'ratio': ratio}
+
+response_cache = ResponseCache()
+
+def conditional(templates, content=None):
+    """
+    Decorator for a public page drawn from :templates:
+
+    :content: is a function returning a list of (token, last modified)
+    validators, one for each thing the page shows besides its templates.
+    """
+    def conditional_decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # views.py imports this module, so we can't import it at the top
+            from .views import get_identity
+
+            # Flashed messages only show once, so never skip drawing them
+            if request.method not in ('GET', 'HEAD') or session.get('_flashes'):
+                return func(*args, **kwargs)
+
+            user = get_identity()
+            etag, last_modified = page_validators(templates, content, user)
+
+            if not_modified(etag, last_modified):
+                response = current_app.response_class(status=304)
+
+            elif user is None:
+                # Everybody who isn't logged in gets the same page
+                response = response_cache.fetch(request.path, etag)
+                if response is None:
+                    response = current_app.make_response(func(*args, **kwargs))
+                    if response.status_code == 200:
+                        response_cache.store(request.path, etag, response)
+
+            else:
+                response = current_app.make_response(func(*args, **kwargs))
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = cache_control(request.endpoint, user is not None)
+            response.vary.add('Cookie')
+
+            return response
+
+        return wrapper
+    return conditional_decorator
@@ -0,0 +1,226 @@
+"""
+Keeps count of how long requests take and how much SQL they run
+
+For every endpoint, request_metrics records:
+
+* a histogram of how long its requests took (METRICS_BUCKETS in config.py),
+* how many of them raised an error,
+* how many SQL statements they ran, and how long those took in total.
+
+Any statement slower than SLOW_QUERY_MS is logged to stderr (through the
+'app.slow_queries' logger), whether or not it was run by a request. The
+webmaster can see it all at /metrics, in the text format Prometheus scrapes.
+
+Keeping count costs a couple of timer calls per request and per statement,
+plus one lock per request, so it's fine to leave on. Set METRICS_ENABLED
+to False to turn it off (and /metrics with it).
+
+The numbers are kept in memory, so they start from zero whenever the
+process starts, and each of serve.py's workers only knows about the
+requests it served itself.
+"""
+
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from bisect import bisect_left
+from timeit import default_timer
+import logging
+import threading
+
+# In seconds; every histogram also gets a +Inf bucket
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Requests that didn't match a route (404s, mostly)
+UNMATCHED = 'unmatched'
+
+# Not app.logger: outside debug mode that only lets errors through
+slow_query_log = logging.getLogger('app.slow_queries')
+
+class EndpointStats(object):
+    """
+    Everything we count for one endpoint
+    """
+    def __init__(self, buckets):
+        # Not cumulative: bucket_counts[i] counts the requests that fell in bucket i
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.errors = 0
+        self.statements = 0
+        self.statement_seconds = 0.0
+
+class Metrics(object):
+    """
+    Per endpoint request and SQL statistics for one process
+    """
+    def __init__(self):
+        self.enabled = False
+        self.buckets = DEFAULT_BUCKETS
+        self.slow_query_ms = None
+        self.slow_queries = 0
+
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+        # What the request being served on this thread has run so far
+        self._current = threading.local()
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', True)
+        self.buckets = sorted(app.config.get('METRICS_BUCKETS', DEFAULT_BUCKETS))
+        self.slow_query_ms = app.config.get('SLOW_QUERY_MS')
+
+        if self.slow_query_ms is not None and not slow_query_log.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter('[%(asctime)s] %(message)s'))
+            slow_query_log.addHandler(handler)
+            slow_query_log.setLevel(logging.WARNING)
+
+        if not self.enabled:
+            return
+
+        app.before_request(self._start_request)
+        app.teardown_request(self._end_request)
+
+        # Every engine, so the read engine is counted too
+        if not event.contains(Engine, 'before_cursor_execute', self._start_statement):
+            event.listen(Engine, 'before_cursor_execute', self._start_statement)
+            event.listen(Engine, 'after_cursor_execute', self._end_statement)
+
+    #### Requests ####
+
+    def _start_request(self):
+        current = self._current
+        current.started = default_timer()
+        current.statements = 0
+        current.statement_seconds = 0.0
+
+    def _end_request(self, exc):
+        current = self._current
+        started = getattr(current, 'started', None)
+        if started is None:
+            return
+        current.started = None
+
+        seconds = default_timer() - started
+        endpoint = request.endpoint or UNMATCHED
+
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats(self.buckets)
+
+            stats.bucket_counts[bisect_left(self.buckets, seconds)] += 1
+            stats.count += 1
+            stats.seconds += seconds
+            stats.statements += current.statements
+            stats.statement_seconds += current.statement_seconds
+            if exc is not None:
+                stats.errors += 1
+
+    #### SQL statements ####
+
+    def _start_statement(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(default_timer())
+
+    def _end_statement(self, conn, cursor, statement, parameters, context, executemany):
+        seconds = default_timer() - conn.info['metrics_started'].pop()
+
+        current = self._current
+        if getattr(current, 'started', None) is not None:
+            current.statements += 1
+            current.statement_seconds += seconds
+
+        if self.slow_query_ms is not None and seconds * 1000 >= self.slow_query_ms:
+            self.slow_queries += 1
+            slow_query_log.warning("Slow query (%.0fms): %s", seconds * 1000, statement[:500])
+
+    #### Reporting ####
+
+    def snapshot(self):
+        """
+        Return a copy of the per endpoint stats, as {endpoint: EndpointStats}
+        """
+        with self._lock:
+            copies = {}
+            for (endpoint, stats) in self._endpoints.items():
+                copy = EndpointStats(self.buckets)
+                copy.__dict__.update(stats.__dict__)
+                copy.bucket_counts = list(stats.bucket_counts)
+                copies[endpoint] = copy
+
+        return copies
+
+    def prometheus(self, caches=None):
+        """
+        Return the stats in Prometheus' text format
+
+        :caches: is a dict of name -> cache, for anything with a stats()
+        returning hits and misses (and maybe size and ratio) to be reported
+        as well. Caches that don't say their hit ratio get it worked out
+        from the hits and misses.
+        """
+        endpoints = sorted(self.snapshot().items())
+        lines = []
+
+        def metric(name, kind, help):
+            lines.append("# HELP {0} {1}".format(name, help))
+            lines.append("# TYPE {0} {1}".format(name, kind))
+
+        metric('sns_request_duration_seconds', 'histogram', "How long requests took, by endpoint")
+        for (endpoint, stats) in endpoints:
+            label = 'endpoint="{0}"'.format(escape(endpoint))
+            total = 0
+            for (bound, count) in zip(self.buckets + ['+Inf'], stats.bucket_counts):
+                total += count
+                lines.append('sns_request_duration_seconds_bucket{{{0},le="{1}"}} {2}'.format(label, bound, total))
+            lines.append('sns_request_duration_seconds_sum{{{0}}} {1!r}'.format(label, stats.seconds))
+            lines.append('sns_request_duration_seconds_count{{{0}}} {1}'.format(label, stats.count))
+
+        counters = [
+            ('sns_request_errors_total', 'errors', "Requests that raised an error, by endpoint"),
+            ('sns_db_statements_total', 'statements', "SQL statements run by requests, by endpoint"),
+            ('sns_db_seconds_total', 'statement_seconds', "Time spent running SQL statements, by endpoint"),
+        ]
+        for (name, attribute, help) in counters:
+            metric(name, 'counter', help)
+            for (endpoint, stats) in endpoints:
+                lines.append('{0}{{endpoint="{1}"}} {2!r}'.format(name, escape(endpoint), getattr(stats, attribute)))
+
+        metric('sns_db_slow_queries_total', 'counter',
+               "SQL statements slower than SLOW_QUERY_MS, by requests or not")
+        lines.append('sns_db_slow_queries_total {0}'.format(self.slow_queries))
+
+        if caches:
+            stats = [(name, with_ratio(cache.stats())) for (name, cache) in sorted(caches.items())]
+
+            for (key, name, kind, help) in [
+                    ('hits', 'sns_cache_hits_total', 'counter', "Cache hits, by cache"),
+                    ('misses', 'sns_cache_misses_total', 'counter', "Cache misses, by cache"),
+                    ('size', 'sns_cache_size', 'gauge', "Cache size, by cache"),
+                    ('ratio', 'sns_cache_hit_ratio', 'gauge', "Fraction of lookups that were hits, by cache")]:
+                metric(name, kind, help)
+                for (cache, values) in stats:
+                    if key in values:
+                        lines.append('{0}{{cache="{1}"}} {2!r}'.format(name, escape(cache), values[key]))
+
+        return "\n".join(lines) + "\n"
+
+def with_ratio(stats):
+    """
+    Return :stats: with a hit ratio, working it out if it isn't there
+    """
+    if 'ratio' in stats:
+        return stats
+
+    lookups = stats['hits'] + stats['misses']
+    return dict(stats, ratio=float(stats['hits']) / lookups if lookups else 0.0)
+
+def escape(value):
+    """
+    Escape a Prometheus label value
+    """
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+request_metrics = Metrics()
@@ -3,19 +3,81 @@ Handles the databases and their properties
 """
 
 from app import db
+from .cache import user_cache
+from . import passwords
+from sqlalchemy.exc import IntegrityError
+from contextlib import contextmanager
 from datetime import datetime
-from werkzeug import generate_password_hash, check_password_hash
 import os
 
 class QueryMixin(object):
     """
     Allows us to easily query and modify the database
+
+    Every create/update/save commits straight away, unless it happens
+    inside a `with QueryMixin.batch():` block, in which case everything
+    in the block is committed together at the end.
     """
     @classmethod
     def create(cls, *args, **kwargs):
         instance = cls(*args, **kwargs)
         return instance.save()
 
+    @classmethod
+    def bulk_create(cls, rows):
+        """
+        Create one instance for each tuple of constructor arguments in :rows:
+
+        They all go into the database with a single executemany rather than
+        an INSERT (and a commit) each. The instances we hand back don't
+        know their ids, so query for them if you need those.
+        """
+        instances = [cls(*row) for row in rows]
+
+        db.session.bulk_save_objects(instances)
+        _commit()
+
+        return instances
+
+    @staticmethod
+    @contextmanager
+    def batch():
+        """
+        Run a group of creates/updates as one transaction
+
+            with QueryMixin.batch():
+                user.update(name=name)
+                AuditionTimes.create(show, time, user)
+
+        Inside the block, save() only flushes (so ids still get filled in).
+        The whole lot is committed when the outermost block ends, or rolled
+        back if it raises. Blocks can be nested.
+        """
+        info = db.session.info
+        depth = info.get('batch_depth', 0)
+
+        if depth == 0:
+            info['batch_saved'] = []
+        info['batch_depth'] = depth + 1
+
+        try:
+            yield
+
+            if depth == 0:
+                db.session.commit()
+                for instance in info['batch_saved']:
+                    instance.after_save()
+
+        except:
+            if depth == 0:
+                db.session.rollback()
+            raise
+
+        finally:
+            info['batch_depth'] = depth
+            if depth == 0:
+                del info['batch_saved']
+
     def update(self, **kwargs):
         for key in kwargs:
             setattr(self, key, kwargs[key])
@@ -23,10 +85,52 @@ class QueryMixin(object):
 
     def save(self, commit=True):
         db.session.add(self)
+
+        if _in_batch():
+            # Hold off on the commit (and on telling the caches) until the batch is done
+            db.session.flush()
+            db.session.info['batch_saved'].append(self)
+            return self
+
         if commit:
             db.session.commit()
+        self.after_save()
         return self
 
+    def after_save(self):
+        """
+        Called whenever an instance is saved, so caches can throw away stale copies
+        """
+        pass
+
+def _in_batch():
+    """
+    Are we inside a QueryMixin.batch() block?
+    """
+    return db.session.info.get('batch_depth', 0) > 0
+
+def _commit():
+    """
+    Commit the session, unless a QueryMixin.batch() will do it for us later
+    """
+    if not _in_batch():
+        db.session.commit()
+
+def _chunks(items, size=500):
+    """
+    Split :items: into lists of at most :size: things
+    """
+    items = list(items)
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+def _starts_with(column, prefix):
+    """
+    A filter for :column: starting with :prefix:, that can use an index on :column:
+    """
+    after = prefix[:-1] + unichr(ord(prefix[-1]) + 1)
+    return db.and_(column >= prefix, column < after)
+
 class User(db.Model, QueryMixin):
     """
     A table of Users of the website
@@ -48,29 +152,119 @@ class User(db.Model, QueryMixin):
     user_level = db.Column(db.Integer, index=True)
     date_joined = db.Column(db.DateTime, index=True)
 
-    def __init__(self, name, email, password):
+    def __init__(self, name, email, password, password_hash=None):
         """
         Create a new user
+
+        If the password has already been hashed, pass it as :password_hash:
+        (and None as :password:) to skip hashing it again.
         """
         self.name = name.lower()
         self.email = email.lower()
         self.user_level = 0
 
-        self.set_password(password)
+        if password_hash is None:
+            self.set_password(password)
+        else:
+            self.password_hash = password_hash
 
         self.date_joined = datetime.utcnow()
 
+    @classmethod
+    def bulk_create(cls, rows):
+        """
+        Like QueryMixin.bulk_create, for rows of (name, email, password),
+        but with all the passwords hashed in parallel first
+        """
+        rows = list(rows)
+        hashes = passwords.hash_passwords([password for (name, email, password) in rows])
+
+        return super(User, cls).bulk_create((name, email, None, pwhash)
+                for ((name, email, password), pwhash) in zip(rows, hashes))
+
     def set_password(self, password):
         """
         Salt and hash the password before we store it.
         """
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
         """
         Compare the offered password with our salted/hashed one
+
+        If it matches, but was hashed with settings we've since changed,
+        quietly rehash it with the current ones.
+        """
+        if not passwords.check_password(self.password_hash, password):
+            return False
+
+        if passwords.needs_rehash(self.password_hash):
+            self.set_password(password)
+            self.save()
+
+        return True
+
+    def after_save(self):
+        """
+        Make sure no worker keeps using our old name, email or user_level
+        """
+        user_cache.forget(self.id)
+
+    @classmethod
+    def directory(cls, prefix=None):
+        """
+        Query the id, name, email and user_level (and nothing else) of every
+        user, by name. If :prefix: is given, only users whose name or email
+        starts with it.
+
+        Names and emails are stored in lower case, so the prefix is lowered
+        too. It's matched as a range on the name and email indexes rather
+        than with LIKE, which sqlite can't use an index for.
+        """
+        query = cls.query.with_entities(cls.id, cls.name, cls.email, cls.user_level)
+
+        if prefix:
+            prefix = prefix.lower()
+            query = query.filter(db.or_(_starts_with(cls.name, prefix), _starts_with(cls.email, prefix)))
+
+        return query.order_by(cls.name)
+
+    @classmethod
+    def change_level(cls, user_level, grant=(), revoke=(), exempt=()):
         """
-        return check_password_hash(self.password_hash, password)
+        Give :user_level: to the users in :grant:, and take it away from
+        the users in :revoke: (dropping them back to 0)
+
+        Nobody in :exempt: is touched, and neither is anybody in both lists.
+        Users are only ever promoted, so e.g. making admins can't demote a
+        webmaster, and only users who actually have :user_level: lose it.
+
+        Returns how many users were promoted and demoted. This is one UPDATE
+        for each, all committed together.
+        """
+        exempt = set(exempt)
+        grant, revoke = set(grant) - exempt, set(revoke) - exempt
+        grant, revoke = grant - revoke, revoke - grant
+
+        promoted = demoted = 0
+
+        # SQLite only takes so many parameters per statement, so really
+        # long lists get split up (still within the one transaction)
+        for chunk in _chunks(grant):
+            promoted += cls.query.filter(cls.email.in_(chunk)).filter(cls.user_level < user_level)\
+                    .update({'user_level': user_level}, synchronize_session=False)
+
+        for chunk in _chunks(revoke):
+            demoted += cls.query.filter(cls.email.in_(chunk)).filter_by(user_level=user_level)\
+                    .update({'user_level': 0}, synchronize_session=False)
+
+        _commit()
+
+        # A bulk UPDATE doesn't go through save(), so forget everyone by hand
+        if promoted or demoted:
+            user_cache.forget_all()
+
+        return promoted, demoted
 
     def __repr__(self):
         return '<User: {name} Level: {level}>'.format(name=self.name, level=self.user_level)
@@ -79,9 +273,11 @@ class PossibleAuditionTimes(db.Model, QueryMixin):
     """
     A table of the legal audition times for any given show
     """
-    
+    # upcoming_blocks looks blocks up by show and date together
+    __table_args__ = (db.Index('ix_possible_audition_times_show_date', 'show', 'date'),)
+
     id = db.Column(db.Integer, primary_key=True)
-    show = db.Column(db.String(64), index=True)
+    show = db.Column(db.String(64))
     date = db.Column(db.DateTime, index=True)
 
     start_time = db.Column(db.DateTime)
@@ -101,22 +297,155 @@ class PossibleAuditionTimes(db.Model, QueryMixin):
 
         self.audition_length = audition_length
 
+def slot_time(time):
+    """
+    Audition slots are to the minute, so drop any seconds from :time:
+    """
+    return time.replace(second=0, microsecond=0)
+
+class SlotTaken(Exception):
+    """
+    Somebody else already has that audition slot
+    """
+    pass
+
 class AuditionTimes(db.Model, QueryMixin):
     """
     A table of who is auditioning for what when
+
+    Each slot of a show can only be taken once, which the database enforces.
+
+    Slots are looked up by :time: (to the minute). :time_str: is just
+    for showing people, since it doesn't even have the year in it.
+    (migrate.py brings older databases up to date with these indexes.)
     """
+    __table_args__ = (db.Index('ix_audition_times_show_time', 'show', 'time', unique=True),
+                      db.Index('ix_audition_times_show_user_id', 'show', 'user_id'))
+
     id = db.Column(db.Integer, primary_key=True)
-    show = db.Column(db.String(64), index=True)
-    time_str = db.Column(db.String(64), index=True)
+    show = db.Column(db.String(64))
+    time_str = db.Column(db.String(64))
     time = db.Column(db.DateTime)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 
+    # The auditioner gets pulled in with the same query as the audition,
+    # so listing auditions doesn't cost an extra query per person
+    user = db.relationship('User', lazy='joined',
+            backref=db.backref('auditions', lazy='dynamic'))
+
     def __init__(self, show, time, user):
         self.show = show
-        self.time = time
+        self.time = slot_time(time)
         self.time_str = time.strftime("%B %d %H:%M")
-        self.user_id = user.id
+        self.user = user
+
+    def __repr__(self):
+        return '<Audition for {show} at {time} :: {person}>'.format(show=self.show, time=self.time, person=self.user)
+
+    @classmethod
+    def reserve(cls, show, time, user):
+        """
+        Sign :user: up for the :time: slot of :show:, replacing the slot
+        they had before (if any), all in one transaction
+
+        We don't check that the slot is free first. The unique constraint
+        on (show, time) does that for us, so when two people go for the
+        same slot at once exactly one gets it, and the other gets SlotTaken
+        and keeps whatever slot they had.
+
+        Returns the time of the audition that got replaced, or None
+        """
+        time = slot_time(time)
+
+        try:
+            with QueryMixin.batch():
+                old = db.session.query(cls.time).filter_by(show=show, user_id=user.id).first()
+                if old is not None:
+                    cls.query.filter_by(show=show, user_id=user.id).delete()
+
+                cls.create(show, time, user)
+
+        except IntegrityError:
+            raise SlotTaken(show, time)
+
+        return old.time if old is not None else None
+
+class AuditionReminder(db.Model, QueryMixin):
+    """
+    A record of every audition somebody has been sent a reminder email for
+
+    Auditions get deleted and re-made when people change their time, so
+    we remember the (user, show, time) rather than the audition's id.
+    """
+    __table_args__ = (db.UniqueConstraint('user_id', 'show', 'time'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    show = db.Column(db.String(64))
+    time = db.Column(db.DateTime)
+    sent_at = db.Column(db.DateTime)
+
+    def __init__(self, audition):
+        self.user_id = audition.user_id
+        self.show = audition.show
+        self.time = audition.time
+        self.sent_at = datetime.utcnow()
+
+class Announcement(db.Model, QueryMixin):
+    """
+    Every version of the announcements on the homepage
+
+    The newest (highest id) is the one being shown.
+
+    * html is already sanitized, so it can go straight onto the page
+    * author_id is the webmaster who posted it
+    * posted_at is when they posted it
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    html = db.Column(db.Text)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    posted_at = db.Column(db.DateTime)
+
+    def __init__(self, html, author):
+        self.html = html
+        self.author_id = author.id if author else None
+        self.posted_at = datetime.utcnow()
+
+class OutgoingEmail(db.Model, QueryMixin):
+    """
+    A queue of emails waiting to be sent (see outbox.py)
+
+    * recipients is a comma separated list of addresses
+    * attempts is how many times sending it has failed so far
+    * send_after is the earliest we'll (re)try sending it
+    * claimed_by/claimed_until mark which outbox worker is sending it,
+      so two processes don't both send the same email
+    * sent_at is when it went out, None until then
+    * last_error is why the last attempt failed
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255))
+    sender = db.Column(db.String(120))
+    recipients = db.Column(db.Text)
+    body = db.Column(db.Text)
+
+    created_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer)
+    send_after = db.Column(db.DateTime, index=True)
+    claimed_by = db.Column(db.String(32), index=True)
+    claimed_until = db.Column(db.DateTime)
+    sent_at = db.Column(db.DateTime, index=True)
+    last_error = db.Column(db.Text)
+
+    def __init__(self, subject, sender, recipients, body):
+        self.subject = subject
+        self.sender = sender
+        self.recipients = ",".join(recipients)
+        self.body = body
+
+        self.created_at = datetime.utcnow()
+        self.send_after = self.created_at
+        self.attempts = 0
 
     def __repr__(self):
-        person = User.query.filter_by(id=self.user_id).first()
-        return '<Audition for {show} at {time} :: {person}>'.format(show=self.show, time=self.time, person=person)
+        return '<Email {subject} to {recipients}>'.format(subject=self.subject, recipients=self.recipients)
@@ -0,0 +1,166 @@
+"""
+Sends email in the background
+
+Nothing that handles a request talks to the mail server. Instead,
+enqueue() saves the email as an OutgoingEmail row and pokes a background
+thread, which sends everything that's due over a single SMTP connection.
+
+If sending fails, the email is tried again later, waiting MAIL_RETRY_DELAY
+seconds after the first failure and twice as long after each one after
+that, until it has failed MAIL_MAX_ATTEMPTS times.
+
+Because the queue lives in the database, emails survive a restart, and
+any process (a web worker, or a script) can call drain()
+to send whatever is waiting.
+"""
+
+from app import db
+from .models import OutgoingEmail
+from .background import BackgroundThread
+from flask import current_app
+from datetime import datetime, timedelta
+import smtplib
+import socket
+import threading
+import uuid
+
+def enqueue(subject, sender, recipients, body):
+    """
+    Queue up an email and wake the background sender
+    """
+    email = OutgoingEmail.create(subject, sender, recipients, body)
+    wake()
+
+    return email
+
+def drain(limit=None):
+    """
+    Send every email that's due, over one SMTP connection
+
+    Returns how many emails went out.
+    """
+    emails = _claim(limit or current_app.config['MAIL_OUTBOX_BATCH'])
+    if not emails:
+        return 0
+
+    sent = 0
+    try:
+        with _mail().connect() as connection:
+            for email in emails:
+                try:
+                    connection.send(_message(email))
+                except (smtplib.SMTPServerDisconnected, socket.error):
+                    # The connection is gone, so the rest can't go out either
+                    raise
+                except Exception as e:
+                    # Something wrong with this email in particular
+                    _failed(email, e)
+                else:
+                    # Record it straight away, so nothing that's gone out
+                    # gets sent again if we die before the end of the batch
+                    email.sent_at = datetime.utcnow()
+                    db.session.commit()
+                    sent += 1
+
+    except (smtplib.SMTPException, socket.error) as e:
+        # Couldn't connect, or lost the connection part way
+        for email in emails:
+            if email.sent_at is None and email.claimed_by is not None:
+                _failed(email, e)
+
+    return sent
+
+def _claim(limit):
+    """
+    Mark up to :limit: due emails as ours to send, and return them
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+
+    due = db.session.query(OutgoingEmail.id)\
+            .filter(OutgoingEmail.sent_at == None)\
+            .filter(OutgoingEmail.send_after <= now)\
+            .filter(db.or_(OutgoingEmail.claimed_until == None, OutgoingEmail.claimed_until < now))\
+            .order_by(OutgoingEmail.id).limit(limit)
+    ids = [email_id for (email_id,) in due]
+    if not ids:
+        return []
+
+    # Another process might have grabbed some of these since we looked,
+    # so the claim re-checks claimed_until and we only keep what we got
+    lease = now + timedelta(seconds=current_app.config['MAIL_CLAIM_SECONDS'])
+    OutgoingEmail.query.filter(OutgoingEmail.id.in_(ids))\
+            .filter(db.or_(OutgoingEmail.claimed_until == None, OutgoingEmail.claimed_until < now))\
+            .update({'claimed_by': token, 'claimed_until': lease}, synchronize_session=False)
+    db.session.commit()
+
+    return OutgoingEmail.query.filter_by(claimed_by=token).order_by(OutgoingEmail.id).all()
+
+def _failed(email, error):
+    """
+    Put an email back in the queue to try again later (or give up on it)
+    """
+    email.attempts += 1
+    email.last_error = str(error)
+    email.claimed_by = None
+    email.claimed_until = None
+
+    if email.attempts >= current_app.config['MAIL_MAX_ATTEMPTS']:
+        # Never going to happen, so stop trying
+        email.send_after = datetime.max
+        current_app.logger.error("Giving up on %r: %s", email, error)
+    else:
+        delay = current_app.config['MAIL_RETRY_DELAY'] * 2 ** (email.attempts - 1)
+        email.send_after = datetime.utcnow() + timedelta(seconds=delay)
+
+    db.session.commit()
+
+def _mail():
+    """
+    Return the app's Flask-Mail, setting it up the first time. It's only
+    imported here, so nothing that just queues emails has to load it.
+    """
+    from flask_mail import Mail
+
+    state = current_app.extensions.get('mail')
+    if state is None:
+        Mail(current_app)
+        state = current_app.extensions['mail']
+
+    return state
+
+def _message(email):
+    from flask_mail import Message
+    return Message(email.subject, sender=email.sender,
+            recipients=email.recipients.split(","), body=email.body)
+
+#### The background sender ####
+
+_wakeup = threading.Event()
+
+def wake():
+    """
+    Tell the background sender there's mail, starting it if it isn't running
+    """
+    _sender.ensure_running()
+    _wakeup.set()
+
+def _run(app):
+    """
+    Drain the outbox whenever we're woken up, and every MAIL_OUTBOX_POLL
+    seconds anyway so that retries go out when they're due
+    """
+    while True:
+        _wakeup.wait(app.config['MAIL_OUTBOX_POLL'])
+        _wakeup.clear()
+
+        with app.app_context():
+            try:
+                while drain():
+                    pass
+            except Exception:
+                app.logger.exception("Outbox failed to drain")
+            finally:
+                db.session.remove()
+
+_sender = BackgroundThread("outbox", _run)
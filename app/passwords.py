@@ -0,0 +1,83 @@
+"""
+Salts, hashes and checks passwords on a small pool of worker threads
+
+Hashing a password is slow on purpose. Doing it on a bounded pool means
+a burst of logins queues up for a few hashing threads instead of eating
+every request thread's CPU at once. werkzeug's pbkdf2 runs inside
+hashlib, which lets go of the GIL, so the pool threads really do run
+side by side.
+
+How passwords are hashed is set in config.py:
+
+* PASSWORD_HASH_METHOD is a werkzeug method *including* the number of
+  iterations, e.g. 'pbkdf2:sha256:50000'
+* PASSWORD_SALT_LENGTH is the number of characters of salt
+* PASSWORD_HASH_WORKERS is the size of the pool
+
+Hashes made with older settings are spotted by needs_rehash, so User can
+upgrade them the next time somebody logs in.
+"""
+
+from flask import current_app
+from multiprocessing.pool import ThreadPool
+from werkzeug import generate_password_hash, check_password_hash
+import os
+import threading
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    """
+    Return the hashing pool, starting it if need be
+
+    A pool doesn't survive a fork, so every process gets its own.
+    """
+    global _pool, _pool_pid
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ThreadPool(current_app.config.get('PASSWORD_HASH_WORKERS', 4))
+            _pool_pid = os.getpid()
+
+    return _pool
+
+def _hash(args):
+    password, method, salt_length = args
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+def _hash_args(password):
+    # The pool threads have no app context, so they get handed the settings
+    return (password, current_app.config['PASSWORD_HASH_METHOD'],
+            current_app.config['PASSWORD_SALT_LENGTH'])
+
+def hash_password(password):
+    """
+    Return a salted hash of :password:
+    """
+    return _get_pool().apply(_hash, (_hash_args(password),))
+
+def hash_passwords(passwords):
+    """
+    Return a salted hash of each password in :passwords:, hashing them in parallel
+    """
+    return _get_pool().map(_hash, [_hash_args(p) for p in passwords])
+
+def check_password(pwhash, password):
+    """
+    Does :password: match the salted hash :pwhash:?
+    """
+    return _get_pool().apply(check_password_hash, (pwhash, password))
+
+def needs_rehash(pwhash):
+    """
+    Was :pwhash: made with something other than the current settings?
+    """
+    if pwhash.count('$') < 2:
+        return True
+
+    method, salt = pwhash.split('$')[:2]
+
+    return (method != current_app.config['PASSWORD_HASH_METHOD'] or
+            len(salt) != current_app.config['PASSWORD_SALT_LENGTH'])
@@ -0,0 +1,252 @@
+"""
+The homepage slideshow photos
+
+Webmasters upload photos through /upload-photo. save_upload() copies the
+upload into static/images/homepage/ a chunk at a time, so a big photo is
+never held in memory all at once.
+
+The originals are much bigger than most screens need, so every photo also
+gets smaller, recompressed copies (one per width in PHOTO_VARIANT_WIDTHS)
+in static/images/homepage/variants/. index.html lists them in a srcset and
+the browser downloads whichever fits. Making them takes a while, so
+uploads queue it up for a background thread; build_assets.py makes any
+that are missing.
+
+Resizing needs Pillow (it's in requirements.txt). Without it, no variants
+are made, the slideshow just shows the originals, and the website logs an
+error saying so when it starts.
+"""
+
+from .background import BackgroundThread
+from .cache import content_cache
+from flask import current_app, url_for
+from werkzeug import secure_filename
+import errno
+import itertools
+import os
+import pkgutil
+import Queue
+import tempfile
+
+def pillow():
+    """
+    Return Pillow's Image module, or None if Pillow isn't installed
+
+    It takes a while to import, and only the resizing needs it.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    return Image
+
+def warn_without_pillow(app):
+    """
+    Complain (once, when the app starts) if Pillow isn't installed, since
+    otherwise the only sign is that phones get sent the full size photos
+
+    This only looks for Pillow, it doesn't import it.
+    """
+    if pkgutil.find_loader('PIL') is None:
+        app.logger.error("Pillow isn't installed, so no smaller copies of the slideshow "
+                         "photos will be made (pip install -r requirements.txt)")
+
+def photo_dir():
+    return os.path.join(os.getcwd(), "app", "static", "images", "homepage")
+
+def variant_dir():
+    return os.path.join(photo_dir(), "variants")
+
+def allowed_file(filename):
+    """
+    Check if a file's extension is allowed
+    """
+    extensions = current_app.config.get('ALLOWED_EXTENSIONS', ())
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in extensions
+
+def save_upload(upload):
+    """
+    Save an uploaded photo (a werkzeug FileStorage) into the slideshow,
+    and return the name it was saved under, or None if it isn't allowed
+
+    If the slideshow already has a photo by that name, the new one gets a
+    number added to its name rather than replacing it.
+    """
+    filename = secure_filename(upload.filename or '')
+    if not filename or not allowed_file(filename):
+        return None
+
+    chunk_size = current_app.config.get('UPLOAD_CHUNK_SIZE', 64 * 1024)
+
+    # Write to a temporary file and move it into place, so the homepage
+    # never shows half a photo. It's written in variants/ (which is on the
+    # same disk) so the slideshow never lists it, even if we're killed
+    # halfway through and it never gets cleaned up.
+    if not os.path.isdir(variant_dir()):
+        os.makedirs(variant_dir())
+
+    fd, temp_path = tempfile.mkstemp(dir=variant_dir(), prefix='.upload-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = upload.stream.read(chunk_size)
+                if not chunk:
+                    break
+                out.write(chunk)
+        os.chmod(temp_path, 0644)
+        filename = _move_into_place(temp_path, filename)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    return filename
+
+def _move_into_place(temp_path, filename):
+    """
+    Link :temp_path: into the slideshow as :filename:, or as name-1.ext,
+    name-2.ext, ... if that's taken, and return the name used
+    """
+    root, extension = os.path.splitext(filename)
+
+    for i in itertools.count():
+        name = filename if i == 0 else "{0}-{1}{2}".format(root, i, extension)
+
+        # Variants of an old photo by the same name would be shown instead of the new one
+        if any(os.path.exists(os.path.join(variant_dir(), variant_name(name, width)))
+               for width in current_app.config.get('PHOTO_VARIANT_WIDTHS', [])):
+            continue
+
+        # Unlike rename, link never replaces a photo that's already there
+        # (even one another worker saved a moment ago)
+        try:
+            os.link(temp_path, os.path.join(photo_dir(), name))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            continue
+
+        return name
+
+#### Variants ####
+
+def variant_name(filename, width):
+    root = os.path.splitext(filename)[0]
+    return "{0}-{1}.jpg".format(root, width)
+
+def variants(filename):
+    """
+    Return [(name, width)] for the variants of a photo that have been made
+    """
+    made = []
+    for width in current_app.config.get('PHOTO_VARIANT_WIDTHS', []):
+        name = variant_name(filename, width)
+        if os.path.isfile(os.path.join(variant_dir(), name)):
+            made.append((name, width))
+
+    return made
+
+def make_variants(filename):
+    """
+    Make the missing (or out of date) variants of one photo
+
+    Returns how many were written.
+    """
+    Image = pillow()
+    if Image is None:
+        return 0
+
+    source = os.path.join(photo_dir(), filename)
+    if not os.path.isdir(variant_dir()):
+        os.makedirs(variant_dir())
+
+    try:
+        original = Image.open(source)
+        original.load()
+    except IOError:
+        current_app.logger.warning("Can't make variants of %s, it isn't an image", filename)
+        return 0
+
+    if original.mode not in ('RGB', 'L'):
+        original = original.convert('RGB')
+
+    written = 0
+    for width in current_app.config.get('PHOTO_VARIANT_WIDTHS', []):
+        # Never make a photo bigger than it is
+        if width >= original.size[0]:
+            continue
+
+        path = os.path.join(variant_dir(), variant_name(filename, width))
+        if os.path.isfile(path) and os.path.getmtime(path) >= os.path.getmtime(source):
+            continue
+
+        height = int(round(original.size[1] * float(width) / original.size[0]))
+        resized = original.resize((width, height), Image.ANTIALIAS)
+
+        fd, temp_path = tempfile.mkstemp(dir=variant_dir())
+        with os.fdopen(fd, 'wb') as out:
+            resized.save(out, 'JPEG', quality=current_app.config.get('PHOTO_VARIANT_QUALITY', 80),
+                    optimize=True, progressive=True)
+        os.chmod(temp_path, 0644)
+        os.rename(temp_path, path)
+        written += 1
+
+    return written
+
+def make_all_variants():
+    """
+    Make the missing variants of every photo in the slideshow
+    """
+    written = 0
+    for filename in os.listdir(photo_dir()):
+        if os.path.isfile(os.path.join(photo_dir(), filename)) and allowed_file(filename):
+            written += make_variants(filename)
+
+    return written
+
+#### The background resizer ####
+
+_queue = Queue.Queue()
+
+def make_variants_later(filename):
+    """
+    Queue up making a photo's variants, starting the background resizer
+    if it isn't running
+    """
+    if pillow() is None:
+        return
+
+    _resizer.ensure_running()
+    _queue.put(filename)
+
+def _run(app):
+    while True:
+        filename = _queue.get()
+        try:
+            with app.app_context():
+                make_variants(filename)
+        except Exception:
+            app.logger.exception("Couldn't make the variants of %s", filename)
+
+_resizer = BackgroundThread("photos", _run)
+
+#### In templates ####
+
+def photo_srcset(filename):
+    """
+    Return the srcset for a slideshow photo: its variants and the original
+    """
+    made = variants(filename)
+    if not made:
+        return ''
+
+    # Variants only exist if Pillow does, so we can ask it how wide the original is
+    width = content_cache.get(os.path.join(photo_dir(), filename), _image_width)
+    candidates = [('variants/' + name, w) for (name, w) in made] + [(filename, width)]
+
+    return ", ".join("{0} {1}w".format(photo_url(name), w) for (name, w) in candidates)
+
+def photo_url(name):
+    return url_for('static', filename='images/homepage/' + name)
+
+def _image_width(path):
+    return pillow().open(path).size[0]
@@ -0,0 +1,256 @@
+"""
+Profiles some of the requests, to see where the time goes when pages get slow
+
+Nothing is profiled unless asked. A request is profiled if either:
+
+* its endpoint is one of `endpoints` (or `endpoints` is empty) and it
+  wins a random draw with probability `rate`, or
+* it has an X-Profile header matching PROFILE_TOKEN in config.py (for
+  profiling one request on purpose, e.g. with curl).
+
+Each profiled request is written to its own file in PROFILE_DIR, named
+after when it happened, how long it took and its endpoint. `format` picks
+what kind:
+
+* 'prof' runs cProfile, which records every function call. It's exact,
+  but it makes the request slower while it's on.
+* 'collapsed' looks at the request's stack every `interval_ms` from
+  another thread, and writes how often each stack was seen, one per line
+  (the format flamegraph.pl takes). It hardly slows the request down, and
+  counts the time spent waiting on the database too.
+
+Only the newest PROFILE_KEEP files are kept (none at all if it's 0).
+
+The settings (rate, endpoints, format, interval_ms) start out as the
+PROFILE_* ones in config.py, but anything in the control file
+(PROFILE_CONTROL, JSON) overrides them, and it's checked on every
+request. So profiling can be switched on and off, in every worker at
+once, without a restart:
+
+    python profiles.py on --rate 0.1 --endpoint main.audition_signup
+    python profiles.py off
+    python profiles.py summary
+"""
+
+from .cache import FileCache
+from flask import current_app, request, g
+from collections import Counter
+from datetime import datetime
+from timeit import default_timer
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+SETTINGS = ['rate', 'endpoints', 'format', 'interval_ms']
+FORMATS = ['prof', 'collapsed']
+
+# The control file, re-read whenever it changes
+_control = FileCache()
+
+def _load_control(path):
+    try:
+        with open(path) as control_file:
+            return json.load(control_file)
+    except (IOError, ValueError):
+        return None
+
+def read_control(path):
+    """
+    Return the settings in the control file at :path:, or {} if there isn't one
+    """
+    return _control.get(path, _load_control) or {}
+
+def write_control(path, settings):
+    """
+    Replace the control file at :path: with :settings:, all at once so
+    no worker ever reads half of it
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'w') as control_file:
+        json.dump(settings, control_file, indent=2, sort_keys=True)
+    os.rename(temp_path, path)
+
+def profile_files(directory):
+    """
+    Return the paths of every profile in :directory:, oldest first
+    """
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return []
+
+    # The names start with when the profile was made
+    return [os.path.join(directory, name) for name in sorted(names)
+            if os.path.splitext(name)[1][1:] in FORMATS]
+
+#### The two kinds of profile ####
+
+class CallProfile(object):
+    """
+    Every call the request makes, with cProfile
+    """
+    extension = 'prof'
+
+    def __init__(self, settings):
+        import cProfile
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def save(self, path):
+        self._profile.dump_stats(path)
+
+class StackSamples(object):
+    """
+    The request's stack, looked at every so often from another thread
+    """
+    extension = 'collapsed'
+
+    def __init__(self, settings):
+        self.interval = settings['interval_ms'] / 1000.0
+        self.thread_id = threading.current_thread().ident
+        self.stacks = Counter()
+
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped:
+            time.sleep(self.interval)
+            if self._stopped:
+                return
+
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                return
+            self.stacks[collapse(frame)] += 1
+
+    def save(self, path):
+        with open(path, 'w') as out:
+            for (stack, count) in self.stacks.most_common():
+                out.write("{0} {1}\n".format(stack, count))
+
+def frame_name(frame):
+    code = frame.f_code
+    path = code.co_filename.split(os.sep)
+    return "{0}:{1}".format("/".join(path[-2:]), code.co_name)
+
+def collapse(frame):
+    """
+    Return :frame:'s stack as "outermost;...;innermost"
+    """
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+
+    return ";".join(reversed(names))
+
+PROFILES = {'prof': CallProfile, 'collapsed': StackSamples}
+
+#### Hooking into requests ####
+
+class Profiler(object):
+    """
+    Decides which requests to profile, and saves their profiles
+    """
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.teardown_request(self._finish)
+
+    def settings(self):
+        """
+        Return the current settings: config.py's, overridden by the control file's
+        """
+        config = current_app.config
+        settings = {
+            'rate': config.get('PROFILE_RATE', 0),
+            'endpoints': config.get('PROFILE_ENDPOINTS', []),
+            'format': config.get('PROFILE_FORMAT', 'prof'),
+            'interval_ms': config.get('PROFILE_INTERVAL_MS', 5),
+        }
+
+        control = config.get('PROFILE_CONTROL')
+        if control:
+            settings.update((k, v) for (k, v) in read_control(control).items() if k in SETTINGS)
+
+        return settings
+
+    def wanted(self, settings):
+        """
+        Should this request be profiled?
+        """
+        token = current_app.config.get('PROFILE_TOKEN')
+        if token and request.headers.get('X-Profile') == token:
+            return True
+
+        if not settings['rate']:
+            return False
+        if settings['endpoints'] and request.endpoint not in settings['endpoints']:
+            return False
+
+        return random.random() < settings['rate']
+
+    def _start(self):
+        settings = self.settings()
+        if not self.wanted(settings):
+            return
+
+        profile = PROFILES.get(settings['format'], CallProfile)(settings)
+        g.profile = (profile, default_timer())
+        profile.start()
+
+    def _finish(self, exc):
+        if 'profile' not in g:
+            return
+        profile, started = g.pop('profile')
+
+        profile.stop()
+        ms = (default_timer() - started) * 1000
+
+        try:
+            self.save(profile, ms)
+        except (IOError, OSError):
+            current_app.logger.exception("Couldn't save a profile")
+
+    def save(self, profile, ms):
+        directory = current_app.config['PROFILE_DIR']
+        keep = max(current_app.config.get('PROFILE_KEEP', 200), 0)
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        name = "{0:%Y%m%d-%H%M%S-%f}-{1:.0f}ms-{2}-{3}.{4}".format(
+                datetime.now(), ms, request.endpoint or 'unmatched', os.getpid(), profile.extension)
+        profile.save(os.path.join(directory, name))
+
+        # Throw away the oldest ones (all of them, if keep is 0)
+        files = profile_files(directory)
+        for path in files[:max(len(files) - keep, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                # Another worker beat us to it
+                pass
+
+profiler = Profiler()
@@ -0,0 +1,14 @@
+$(document).ready(function(){
+  // Only send the boxes that were changed, as grant and revoke
+  $("form.change-level").submit(function(){
+    var form = $(this);
+
+    form.find("input[name=member]").each(function(){
+      if(this.checked != this.defaultChecked){
+        $("<input type=hidden>").attr("name", this.checked ? "grant" : "revoke").val(this.value).appendTo(form);
+      }
+    });
+
+    form.find("input[name=member], input[name=shown]").prop("disabled", true);
+  });
+});
@@ -3,22 +3,31 @@ Deines a relationship between relative urls and html files (i.e. WEBSITE/about l
 
 get_txt: 
   a helper function which retrieves the text from a file passed as input.
-  We use this function to update information on the website, such as subtroupe descriptions
-  and announcements without modifying the source html.
+  We use this function to update information on the website, such as subtroupe descriptions,
+  without modifying the source html. (Announcements live in the database, see announcements.py)
 
 We use the user's email as a token (stored as a cookie in flask `session`) to
 check if a proper user is logged in, and change the functionality appropriately.
 """
-from flask import render_template, flash, redirect, request, session, url_for
-from .forms import LoginForm, SignUpForm, ChooseAdminsForm, ChooseWebmasterForm, CreateAuditionTimesForm, AuditionSignupForm, ShowSelectForm, SettingsForm, AnnouncementsForm
-from .models import User, PossibleAuditionTimes, AuditionTimes
-from bs4 import BeautifulSoup
-from werkzeug import secure_filename
-from app import app, db
+from flask import Blueprint, current_app, render_template, flash, redirect, request, session, url_for, g, abort
+from .forms import LoginForm, SignUpForm, ChangeLevelForm, CreateAuditionTimesForm, AuditionSignupForm, ShowSelectForm, SettingsForm, AnnouncementsForm, UploadPhotoForm
+from .models import User, PossibleAuditionTimes, AuditionTimes, SlotTaken
+from .auditions import available_auditions, expand_blocks, upcoming_blocks, open_shows
+from .cache import user_cache, content_cache
+from .announcements import current_announcements, post_announcements, announcements_version
+from .httpcache import conditional, file_version, response_cache
+from .metrics import request_metrics
+from .database import read_only
+from .photos import photo_dir, variant_dir, allowed_file, save_upload, make_variants_later, photo_srcset
+from app import db
 from functools import wraps
 import datetime
 import os
 
+# Every page of the site (create_app registers this)
+main = Blueprint('main', __name__)
+main.add_app_template_global(photo_srcset)
+
 #### Helper functions ####
 
 def get_slideshow_images():
@@ -30,12 +39,19 @@ def get_slideshow_images():
     The photos get sorted alphabetically, so if you want to reorder
     the slideshow, all you need to do is appropriately rename the
     photo in the folder.
+
+    The list is kept in content_cache until a photo is added, removed or renamed.
+    """
+    return content_cache.get(photo_dir(), list_photos)
+
+def list_photos(path):
+    """
+    Return the sorted names of the photos (not folders or other files) in path
     """
-    path = os.path.join(os.getcwd(), "app", "static", "images", "homepage")
     files = os.listdir(path)
 
     # Filter out just the files.
-    return [f for f in files if os.path.isfile(os.path.join(path, f))]
+    return sorted(f for f in files if os.path.isfile(os.path.join(path, f)) and allowed_file(f))
 
 def get_txt(filename):
   """
@@ -43,50 +59,70 @@ def get_txt(filename):
 
   filename should be a string with extension, for example, "npp.txt"
 
-  If pages that use this function aren't loading properly, particularly
-  if the error message given relates to encoding or ascii, verify that in 
-  whatever file you use as an entry for the program 
-  (run.py for local, wsgi.py for pythonanywhere, etc.) is properly setting
-  its encoding to utf8. Check run.py in this repo for one way of fixing it.
+  The text is kept in content_cache until the file changes.
+
+  The files are read as utf8, so they can have any characters in them
+  without the entry point (run.py, serve.py, ...) needing to change
+  python's default encoding.
   """
-  complete_path = os.path.join(os.getcwd(), "app", "static", "txts", filename)
+  return content_cache.get(txt_path(filename), read_txt)
 
+def txt_path(filename):
+  return os.path.join(os.getcwd(), "app", "static", "txts", filename)
+
+def read_txt(complete_path):
+  """
+  Return the contents of a text file, or its path if it can't be read
+  """
   try:
     with open(complete_path) as text_file:
-      raw_text = text_file.read()
+      raw_text = text_file.read().decode('utf-8')
   except IOError:
     raw_text = complete_path
   
   return raw_text
 
-def sanitize_announcements(html):
+def get_user():
     """
-    Take some html input and keep only safe tags
+    Return the user if there is one logged in, None otherwise
+
+    The user is only looked up once per request. After that we hand back
+    the copy kept on flask.g, so the decorator, the view and the template
+    can all call this for free.
     """
-    VALID_TAGS = ['p', 'ul', 'li', 'br', 'a', 'b', 'i', 'ol', 'u', 'div']
+    if 'email' not in session:
+        return None
 
-    soup = BeautifulSoup(html)
+    # Look the user up again if the session changed underneath us
+    if g.get('user_email') != session['email']:
+        g.user = User.query.filter_by(email=session['email']).first()
+        g.user_email = session['email']
 
-    for tag in soup.findAll(True):
-        if tag.name not in VALID_TAGS:
-            tag.hidden = True
+        # Debug counter, see count_user_lookups
+        g.user_lookups = g.get('user_lookups', 0) + 1
 
-    return soup.renderContents()
+    return g.user
 
-def allowed_file(filename):
-    """
-    Check if a file's extension is allowed
+def get_identity():
     """
-    return '.' in filename and filename.rsplit('.', 1)[1] in allowed_extensions
+    Return the Identity (id, name, email, user_level) of the logged in user,
+    or None if nobody is logged in.
 
-def get_user():
-    """
-    Return the user if there is one logged in, None otherwise
+    This comes out of user_cache when it can, so unlike get_user() it
+    usually doesn't touch the database. Use get_user() when you need to
+    change the user.
     """
     if 'email' not in session:
         return None
-    else:
-        return User.query.filter_by(email=session['email']).first()
+
+    identity = user_cache.lookup(session['email'])
+    if identity is None:
+        user = get_user()
+        if user is None:
+            return None
+        identity = user_cache.remember(user)
+
+    return identity
 
 def require_login(user_level=0):
     """
@@ -103,19 +139,19 @@ def require_login(user_level=0):
             # If there isn't a cookie
             if 'email' not in session:
                 flash("Please log in to access that page")
-                return redirect(url_for('login'))
+                return redirect(url_for('.login'))
 
-            user = User.query.filter_by(email=session['email']).first()
+            user = get_identity()
 
             # If there *is* a cookie but it doesn't correspond to a user
             if user is None:  
                 flash("Please log in to access that page")
-                return redirect(url_for('login'))
+                return redirect(url_for('.login'))
 
             # If there is a user, but they don't have permission
             elif user.user_level < user_level:
                 flash("You do not have permission to access this page")
-                return redirect(url_for('profile'))
+                return redirect(url_for('.profile'))
 
             # We gucci, fam
             else:
@@ -124,43 +160,70 @@ def require_login(user_level=0):
         return wrapper
     return login_decorator
 
+@main.after_app_request
+def count_user_lookups(response):
+    """
+    In debug mode, report how many times this request looked up the user.
+
+    This should never be more than 1.
+    """
+    if current_app.debug:
+        response.headers['X-User-Lookups'] = str(g.get('user_lookups', 0))
+
+    return response
+
 #### routes ####
 
-@app.route('/')
-@app.route('/index')
+# The text files that subtroupes.html is filled in with
+SUBTROUPE_TXTS = ["tisbert.txt", "npp.txt", "workshopping.txt"]
+
+@main.route('/')
+@main.route('/index')
+@read_only
+@conditional(['index.html'], lambda: [announcements_version(), file_version(photo_dir()), file_version(variant_dir())])
 def index():
-    return render_template('index.html', announcements=get_txt("announcements.txt"), user=get_user(), photos=get_slideshow_images())
+    return render_template('index.html', announcements=current_announcements(), user=get_identity(), photos=get_slideshow_images())
 
-@app.route('/about')
+@main.route('/about')
+@read_only
+@conditional(['about.html'])
 def about():
-    return render_template('about.html', title="About Us", user=get_user())
+    return render_template('about.html', title="About Us", user=get_identity())
 
-@app.route('/tickets')
+@main.route('/tickets')
+@read_only
+@conditional(['tickets.html'])
 def tickets():
-    return render_template('tickets.html', title="Buy Tickets", user=get_user())
+    return render_template('tickets.html', title="Buy Tickets", user=get_identity())
 
-@app.route('/subtroupes')
+@main.route('/subtroupes')
+@read_only
+@conditional(['subtroupes.html'], lambda: [file_version(txt_path(f)) for f in SUBTROUPE_TXTS])
 def subtroupes():
     # Dynamically update subtroupes.html with: tisbert.txt, npp.txt, workshopping.txt
     return render_template('subtroupes.html', title="SNS Subtroupes", 
         tisbert_text=get_txt("tisbert.txt"), npp_text=get_txt("npp.txt"), 
-        workshopping_text=get_txt("workshopping.txt"), user=get_user())
+        workshopping_text=get_txt("workshopping.txt"), user=get_identity())
 
-@app.route('/join')
+@main.route('/join')
+@read_only
+@conditional(['join.html'])
 def join():
-    return render_template('join.html', title="Join Us!", user=get_user())
+    return render_template('join.html', title="Join Us!", user=get_identity())
 
-@app.route('/alumni')
+@main.route('/alumni')
+@read_only
+@conditional(['alumni.html'])
 def alumni():
-    return render_template('alumni.html', title="Alumni", user=get_user())
+    return render_template('alumni.html', title="Alumni", user=get_identity())
 
-@app.route('/signup', methods=['GET', 'POST'])
+@main.route('/signup', methods=['GET', 'POST'])
 def signup():
     form = SignUpForm()
 
     if request.method == 'POST':
         if not form.validate():
-            return render_template('signup.html', title="Sign up!", form=form, user=get_user())
+            return render_template('signup.html', title="Sign up!", form=form, user=get_identity())
         else:
             # Create the new user
             newUser = User.create(form.name.data, form.email.data, form.password.data)
@@ -169,33 +232,34 @@ def signup():
             session['email'] = newUser.email
 
             # Redirect to profile
-            return redirect(url_for('profile'))
+            return redirect(url_for('.profile'))
 
     elif request.method == 'GET':
-        return render_template('signup.html', title="Sign up!", form=form, user=get_user())
+        return render_template('signup.html', title="Sign up!", form=form, user=get_identity())
 
-@app.route('/login', methods=['GET', 'POST'])
+@main.route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
 
     if request.method == 'POST':
         if not form.validate():
-            return render_template('login.html', title="Log in!", form=form, user=get_user())
+            return render_template('login.html', title="Log in!", form=form, user=get_identity())
         else:
             session['email'] = form.email.data
-            return redirect(url_for('profile'))
+            return redirect(url_for('.profile'))
 
     elif request.method == 'GET':
-        return render_template('login.html', title="Log in!", form=form, user=get_user())
+        return render_template('login.html', title="Log in!", form=form, user=get_identity())
 
-@app.route('/logout')
+@main.route('/logout')
 def logout():
     if 'email' in session:
         session.pop('email', None)
 
-    return redirect(url_for('index'))
+    return redirect(url_for('.index'))
 
-@app.route('/profile')
+@main.route('/profile')
+@read_only
 @require_login()
 def profile():
     """
@@ -204,9 +268,9 @@ def profile():
     The dynamic content based in user 
     is handled in profile.html
     """
-    return render_template('profile.html', user=get_user())
+    return render_template('profile.html', user=get_identity())
 
-@app.route('/settings', methods=['GET', 'POST'])
+@main.route('/settings', methods=['GET', 'POST'])
 @require_login()
 def settings():
     """
@@ -218,124 +282,74 @@ def settings():
 
     if form.validate_on_submit():
 
-        user.update(name=form.name.data)
-        user.update(email=form.email.data)
+        user.update(name=form.name.data, email=form.email.data)
+
+        # The session knows the user by their email
+        session['email'] = user.email
 
         flash("settings saved")
-        return redirect(url_for('profile'))
+        return redirect(url_for('.profile'))
 
-    return render_template("settings.html", form=form, user=get_user())
+    return render_template("settings.html", form=form, user=get_identity())
 
-@app.route('/adminify', methods=['GET', 'POST'])
-@require_login(2)
-def adminify():
+def change_level_page(user_level, title, exclude, exempt=()):
     """
-    Render a checkbox for each user. Checked boxes correspond to admins
+    Draw (or save) a page of the member list, with a box ticked for
+    everyone who has :user_level:
 
-    note: only the webmaster can see this page
+    The list is searched by name or email prefix (?q=) and shown a page
+    (?page=) of MEMBERS_PER_PAGE at a time. :exclude: filters out users
+    who mustn't be on the list, and nobody in :exempt: is ever changed.
     """
-    form = ChooseAdminsForm()
-
-    # Dynamically populate possible admins with the user list.
-    users = User.query.all()
-    form.admins.choices = [(user.email, user.name) for user in users if user.user_level != 2]
-
-    if request.method == 'POST':
-        if not form.validate():
-            # Dynamically update the prechecked boxes with users who are already admins
-            admins = User.query.filter_by(user_level=1).all()
-            form.admins.data = [user.email for user in admins]
-
-            return render_template('adminify.html', form=form, user=get_user())
+    form = ChangeLevelForm()
 
-        else:
-            old_admin_emails = [user.email for user in users if user.user_level == 1]
+    if form.validate_on_submit():
+        grant, revoke = form.changes()
+        promoted, demoted = User.change_level(user_level, grant, revoke, exempt=exempt)
 
-            for new_admin_email in form.admins.data:
-                user = User.query.filter_by(email=new_admin_email).first()
-                user.update(user_level=1)  # Make the user an admin
+        flash("{0} added, {1} removed".format(promoted, demoted))
+        return redirect(url_for(request.endpoint, **request.args.to_dict()))
 
-                try:
-                    # Remove the admins from old_admin_emails
-                    # so that we're left with a list of people
-                    # to un-admin-ify
-                    old_admin_emails.remove(user.email)
-                except ValueError:
-                    # Get around trying to remove somebody who wasn't an admin
-                    pass
+    search = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
 
-            # Un-admin-ify people who were admins but aren't now
-            for old_admin_email in old_admin_emails:
-                user = User.query.filter_by(email=old_admin_email).first()
-                user.update(user_level=0)
+    members = User.directory(search).filter(exclude)\
+            .paginate(page, current_app.config.get('MEMBERS_PER_PAGE', 50), error_out=False)
 
-            return redirect(url_for('profile'))
+    return render_template('change-level.html', title=title, form=form, members=members,
+                           search=search, level=user_level, user=get_identity())
 
-    elif request.method == 'GET':
-        # Dynamically update the prechecked boxes with users who are already admins
-        admins = User.query.filter_by(user_level=1).all()
-        form.admins.data = [user.email for user in admins]
+@main.route('/adminify', methods=['GET', 'POST'])
+@require_login(2)
+def adminify():
+    """
+    Tick a box for each user who should be an admin
 
-        return render_template('adminify.html', form=form, user=get_user())
+    note: only the webmaster can see this page
+    """
+    # Webmasters are already everything an admin is
+    return change_level_page(1, "Admins", User.user_level != 2)
 
-@app.route('/webmasterify', methods=['GET', 'POST'])
+@main.route('/webmasterify', methods=['GET', 'POST'])
 @require_login(2)
 def webmasterify():
     """
-    Render a checkbox for each user. Checked boxes correspond to webmasters
+    Tick a box for each user who should be a webmaster
 
     note: only the webmaster can see this page
     """
-    form = ChooseWebmasterForm()
-
-    # Dynamically populate possible webmasters with the user list.
-    users = User.query.all()
-    form.masters.choices = [(user.email, user.name) for user in users if user.email != session['email']]
-
-    if request.method == 'POST':
-        if not form.validate():
-            # Dynamically update the prechecked boxes with users who are already admins
-            masters = User.query.filter_by(user_level=2).all()
-            # Make sure you can't un-webmaster yourself, which
-            # could leave us in a situation with no webmaster.
-            form.masters.data = [user.email for user in masters if user.email != session['email']]
-
-            return render_template('webmasterify.html', form=form, user=get_user())
-
-        else:
-            old_master_emails = [user.email for user in users if user.user_level == 2 and user.email != session['email']]
-
-            for new_master_email in form.masters.data:
-                user = User.query.filter_by(email=new_master_email).first()
-                user.update(user_level=2)  # Make the user a webmaster
-
-                try:
-                    old_master_emails.remove(user.email)
-                except ValueError:
-                    pass
+    # Make sure you can't un-webmaster yourself, which
+    # could leave us in a situation with no webmaster.
+    return change_level_page(2, "Webmasters", User.email != session['email'], exempt=[session['email']])
 
-            # Un-webmaster-ify people who were webmasters but aren't now
-            for old_master_email in old_master_emails:
-                user = User.query.filter_by(email=old_master_email).first()
-                user.update(user_level=0)
-
-            return redirect(url_for('profile'))
-
-    elif request.method == 'GET':
-        # Dynamically update the prechecked boxes with users who are already admins
-        masters = User.query.filter_by(user_level=2).all()
-        form.masters.data = [user.email for user in masters]
-
-        return render_template('webmasterify.html', form=form, user=get_user())
-
-@app.route('/make-audition-times', methods=['GET', 'POST'])
+@main.route('/make-audition-times', methods=['GET', 'POST'])
 @require_login(1)
 def make_audition_times():
     form = CreateAuditionTimesForm()
 
     if request.method == 'POST':
         if not form.validate():
-            return render_template('make-audition-times.html', form=form, user=get_user())
+            return render_template('make-audition-times.html', form=form, user=get_identity())
         else:
 
             # WTForms doesn't like passing around datetime objects,
@@ -359,34 +373,29 @@ def make_audition_times():
             audition_length = datetime.timedelta(seconds=audition_length_in_seconds)
 
             PossibleAuditionTimes.create(title, date, start, end, audition_length)
+            open_shows.invalidate()
 
             flash("Audition time created successfully!")
-            return redirect(url_for('profile'))
+            return redirect(url_for('.profile'))
 
     elif request.method == 'GET':
-        return render_template('make-audition-times.html', form=form, user=get_user())
+        return render_template('make-audition-times.html', form=form, user=get_identity())
 
-@app.route('/audition-signup', methods=['GET', 'POST'])
+@main.route('/audition-signup', methods=['GET', 'POST'])
+@read_only
 @require_login()
 def audition_signup_selector():
     """
     Select the show to audition for if there is more than one, otherwise redirect immediately
     """
-    today = datetime.datetime.today()
-
-    all_auditions = PossibleAuditionTimes.query.all()
-    upcoming_auditions = [a for a in all_auditions if a.date > today]
-   
-    shows = set()
-    for a in upcoming_auditions:
-        shows.add(a.show)
+    shows = open_shows.shows()
 
     if len(shows) == 0:
         flash("No upcoming auditions")
-        return redirect(url_for('profile'))
+        return redirect(url_for('.profile'))
 
     if len(shows) == 1:
-        return redirect(url_for('audition_signup', show=shows.pop()))
+        return redirect(url_for('.audition_signup', show=shows[0]))
 
     if len(shows) > 1:
         form = ShowSelectForm()
@@ -394,128 +403,134 @@ def audition_signup_selector():
         
         if request.method == 'POST':
             if not form.validate():
-                return render_template('select-show.html', form=form, user=get_user())
+                return render_template('select-show.html', form=form, user=get_identity())
             else:
-                return redirect(url_for('audition_signup', show=form.shows.data))
+                return redirect(url_for('.audition_signup', show=form.shows.data))
 
         elif request.method == 'GET':
-            return render_template('select-show.html', form=form, user=get_user())
+            return render_template('select-show.html', form=form, user=get_identity())
 
-@app.route('/audition-signup/<string:show>', methods=['GET', 'POST'])
+@main.route('/audition-signup/<string:show>', methods=['GET', 'POST'])
+@read_only
 @require_login()
 def audition_signup(show):
     form = AuditionSignupForm()
 
-    today = datetime.datetime.today()
-
-    all_audition_blocks = PossibleAuditionTimes.query.all()
-    upcoming_audition_blocks = [a for a in all_audition_blocks if a.date > today]
-    relevant_audition_blocks = [a for a in upcoming_audition_blocks if a.show == show]
+    relevant_audition_blocks = upcoming_blocks(show)
 
     days = [a.date.strftime("%A %B %d %Y") for a in relevant_audition_blocks]
 
-    # We expand the relevant audition blocks into a list of every possible audition
-    # the user can sign up for (for a given show)
-    relevant_auditions = []
-    for a in relevant_audition_blocks:
-
-        all_auditions_in_block = []
-        current_start = a.start_time
-        while current_start <= a.end_time:
-            time_str = a.date.strftime("%B %d") + " " + current_start.strftime("%H:%M")
-
-            # If somebody else doesn't have the timeslot
-            if not AuditionTimes.query.filter_by(show=show).filter_by(time_str=time_str).first():
-                all_auditions_in_block.append(current_start.strftime("%H:%M"))
-
-            current_start += a.audition_length
-
-        formatted_auditions = zip([a.date.strftime("%A %B %d %Y")] * len(all_auditions_in_block), all_auditions_in_block)
-        relevant_auditions += formatted_auditions
-
-
-    # We create a complex label here, which codifies all the information
-    # that we need to properly sort and display the audition times in the
-    # html file. The label the user sees will be just the audition time
-    labels = ["{0}::{1}".format(a[0], a[1]) for a in relevant_auditions]
-
-    form.available_times.choices = [(c,c) for c in labels]
+    def offer(auditions):
+        # We create a complex label here, which codifies all the information
+        # that we need to properly sort and display the audition times in the
+        # html file. The label the user sees will be just the audition time
+        labels = ["{0}::{1}".format(a[0], a[1]) for a in auditions]
+        form.available_times.choices = [(c,c) for c in labels]
 
     if request.method == 'POST':
+        # Any slot of an upcoming block is a valid choice here, even one
+        # that's been taken since the page was drawn: reserve() finds out
+        # whether it's still free, so whoever lost the race hears that
+        offer(expand_blocks(relevant_audition_blocks))
+
         if not form.validate():
-            if AuditionTimes.query.filter_by(show=show).filter_by(user_id=get_user().id).first():
+            # We expand the relevant audition blocks into a list of every possible audition
+            # the user can sign up for (for a given show)
+            offer(available_auditions(show, relevant_audition_blocks))
+
+            if AuditionTimes.query.filter_by(show=show).filter_by(user_id=get_identity().id).first():
                 flash("This will overwrite your previous audition time!")
-            return render_template('audition-signup.html', form=form, show=show, days=days, user=get_user())
+            return render_template('audition-signup.html', form=form, show=show, days=days, user=get_identity())
         else:
             user = get_user()
-            
-            # If the user is signed up for an audition time, delete it.
-            old_auditions = AuditionTimes.query.filter_by(show=show).filter_by(user_id=user.id)
-            if old_auditions.first():
-                flash("Deleted audition at {0}".format(old_auditions.first().time.strftime("%H:%M")))
-                old_auditions.delete()
 
             time_raw = form.available_times.data
             datetime_object = datetime.datetime.strptime(time_raw.replace("::", " "), "%A %B %d %Y %H:%M")
 
-            AuditionTimes.create(show, datetime_object, user)
+            try:
+                replaced = AuditionTimes.reserve(show, datetime_object, user)
+            except SlotTaken:
+                flash("Sorry, somebody just took that slot! Please pick another one.")
+                return redirect(url_for('.audition_signup', show=show))
+
+            if replaced is not None:
+                flash("Deleted audition at {0}".format(replaced.strftime("%H:%M")))
 
             time_string = time_raw.replace("::", " @ ")
-            flash("Successfully registered for {0} audition at {1}".format(show, time_string))
-            return redirect(url_for('profile'))
+            flash(u"Successfully registered for {0} audition at {1}".format(show, time_string))
+            return redirect(url_for('.profile'))
 
     elif request.method == 'GET':
-        if AuditionTimes.query.filter_by(show=show).filter_by(user_id=get_user().id).first():
+        # We expand the relevant audition blocks into a list of every possible audition
+        # the user can sign up for (for a given show)
+        offer(available_auditions(show, relevant_audition_blocks))
+
+        if AuditionTimes.query.filter_by(show=show).filter_by(user_id=get_identity().id).first():
             flash("This will overwrite your previous audition time!")
-        return render_template('audition-signup.html', form=form, show=show, days=days, user=get_user())
+        return render_template('audition-signup.html', form=form, show=show, days=days, user=get_identity())
 
-@app.route('/make-announcement', methods=['GET', 'POST'])
+@main.route('/make-announcement', methods=['GET', 'POST'])
 @require_login(2)
 def make_announcement():
     """
     Modify the announcements homepage tab
     """
-    old_text = get_txt("announcements.txt")
-    form = AnnouncementsForm(announcements=old_text)
+    form = AnnouncementsForm(announcements=current_announcements())
 
-    complete_path = os.path.join(os.getcwd(), "app", "static", "txts", "announcements.txt")
+    if request.method == 'POST':
+        if not form.validate():
+            return render_template('make-announcement.html', form=form, user=get_identity())
+        else:
+            # Posting saves a new version, so nothing gets overwritten
+            post_announcements(form.announcements.data, get_user())
 
-    with open(complete_path, 'w+') as old_announcement_file:
+            flash("announcement posted!")
+            return redirect(url_for('.profile'))
 
-        if request.method == 'POST':
-            if not form.validate():
-                return render_template('make_announcement.html', form=form, user=get_user())
-            else:
-                
-                old_announcement_file.write(sanitize_announcements(form.announcements.data))
+    elif request.method == 'GET':
+        return render_template('make-announcement.html', form=form, user=get_identity())
 
-                flash("announcement posted!")
-                return redirect(url_for('profile'))
+@main.route('/upload-photo', methods=['GET', 'POST'])
+@require_login(2)
+def upload_photo():
+    """
+    Add a photo to the homepage slideshow
+    """
+    form = UploadPhotoForm()
 
-        elif request.method == 'GET':
-            return render_template('select-show.html', form=form, user=get_user())
+    if request.method == 'POST':
+        if not form.validate():
+            return render_template('upload-photo.html', form=form, user=get_identity())
+        else:
+            filename = save_upload(form.photo.data)
+            if filename is None:
+                flash("Photos have to be one of: " + ", ".join(sorted(current_app.config['ALLOWED_EXTENSIONS'])))
+                return render_template('upload-photo.html', form=form, user=get_identity())
 
-@app.route('/audition-calendar', methods=['GET', 'POST'])
+            # The smaller copies for phones get made in the background
+            make_variants_later(filename)
+
+            flash("{0} added to the slideshow!".format(filename))
+            return redirect(url_for('.index'))
+
+    elif request.method == 'GET':
+        return render_template('upload-photo.html', form=form, user=get_identity())
+
+@main.route('/audition-calendar', methods=['GET', 'POST'])
+@read_only
 @require_login(1)
 def audition_calendar_selector():
     """
     Have the user potentially choose between a list of avaiable shows to watch the auditions for
     """
-    today = datetime.datetime.today()
-
-    all_auditions = PossibleAuditionTimes.query.all()
-    upcoming_auditions = [a for a in all_auditions if a.date > today]
-   
-    shows = set()
-    for a in upcoming_auditions:
-        shows.add(a.show)
+    shows = open_shows.shows()
 
     if len(shows) == 0:
         flash("No upcoming auditions")
-        return redirect(url_for('profile'))
+        return redirect(url_for('.profile'))
 
     if len(shows) == 1:
-        return redirect(url_for('audition_calendar', show=shows.pop()))
+        return redirect(url_for('.audition_calendar', show=shows[0]))
 
     if len(shows) > 1:
         form = ShowSelectForm()
@@ -523,30 +538,37 @@ def audition_calendar_selector():
         
         if request.method == 'POST':
             if not form.validate():
-                return render_template('select-show.html', form=form, user=get_user())
+                return render_template('select-show.html', form=form, user=get_identity())
             else:
-                return redirect(url_for('audition_calendar', show=form.shows.data))
+                return redirect(url_for('.audition_calendar', show=form.shows.data))
 
         elif request.method == 'GET':
-            return render_template('select-show.html', form=form, user=get_user())
+            return render_template('select-show.html', form=form, user=get_identity())
 
-@app.route('/audition-calendar/<string:show>')
+@main.route('/audition-calendar/<string:show>')
+@read_only
 @require_login(1)
 def audition_calendar(show):
     """
     Show a list of who is auditioning when for a given show
     """
-    auditions = AuditionTimes.query.filter_by(show=show).all()
-    relevant_auditions = [a for a in auditions if a.time > datetime.datetime.today()]
+    # The auditioners are joined in by the same query (see AuditionTimes.user)
+    auditions = AuditionTimes.query.filter_by(show=show)\
+            .filter(AuditionTimes.time > datetime.datetime.today())\
+            .order_by(AuditionTimes.time).all()
 
-    users = []
-    times = []
-    for a in relevant_auditions:
-        user = User.query.filter_by(id=a.user_id).first()
-        users.append(user)
+    to_display = [(a.user, a.time_str) for a in auditions]
 
-        times.append(a.time_str)
+    return render_template('audition-calendar.html', show=show, user=get_identity(), auditions=to_display)
 
-    to_display = zip(users, times)
+@main.route('/metrics')
+@require_login(2)
+def metrics():
+    """
+    Request, SQL and cache statistics for this process, for Prometheus to scrape
+    """
+    if not request_metrics.enabled:
+        abort(404)
 
-    return render_template('audition-calendar.html', show=show, user=get_user(), auditions=to_display)
+    caches = {'user': user_cache, 'content': content_cache, 'response': response_cache}
+    return current_app.response_class(request_metrics.prometheus(caches), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,276 @@
+#!flask/bin/python
+"""
+Benchmarks the busiest pages against a big, made up database
+
+    python bench.py [--users 10000] [--shows 50] [--bookings 3000]
+                    [--requests 50] [--out bench.json] [--compare old.json]
+
+This makes a throwaway sqlite database, fills it with --users members,
+--shows shows (each with a few audition blocks coming up) and --bookings
+booked slots, then requests each page --requests times through Flask's
+test client, logged in as whoever the page is for:
+
+* /index                      (nobody)
+* /login                      (posting a real email and password)
+* /audition-signup/<show>     (a member)
+* /audition-calendar/<show>   (an admin)
+* /adminify                   (a webmaster)
+
+For every page it reports the 50th/90th/99th percentile time and how many
+SQL statements a request ran, and saves it all as JSON. With --compare it
+also lines the results up against an earlier run's JSON, and exits with 1
+if any page got more than --threshold slower or started running more SQL.
+
+Every member shares one password hash, worked out once, so making 10,000
+of them takes about a second rather than over an hour. The same --seed
+always makes the same data.
+"""
+from __future__ import division
+from app import create_app, db
+from app.models import User, PossibleAuditionTimes, AuditionTimes
+from app.passwords import hash_password
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+
+PASSWORD = 'benchmark'
+
+# Each show gets this many audition blocks, on consecutive days
+BLOCKS_PER_SHOW = 4
+BLOCK_START = datetime.time(18, 0)
+BLOCK_HOURS = 3
+AUDITION_MINUTES = 10
+
+#### Making the data ####
+
+def make_users(count, pwhash):
+    """
+    Insert :count: members, plus an admin and a webmaster, with one executemany
+    """
+    rows = [{'name': "Member {0}".format(i), 'email': "member{0}@bench.test".format(i),
+             'password_hash': pwhash, 'user_level': 0} for i in xrange(count)]
+    rows.append({'name': "Admin", 'email': "admin@bench.test", 'password_hash': pwhash, 'user_level': 1})
+    rows.append({'name': "Webmaster", 'email': "webmaster@bench.test", 'password_hash': pwhash, 'user_level': 2})
+
+    db.session.execute(User.__table__.insert(), rows)
+
+def make_shows(count):
+    """
+    Insert BLOCKS_PER_SHOW upcoming audition blocks for each of :count:
+    shows, and return every slot as a (show, datetime) pair
+    """
+    length = datetime.timedelta(minutes=AUDITION_MINUTES)
+    tomorrow = datetime.datetime.combine(datetime.date.today(), datetime.time()) + datetime.timedelta(days=1)
+
+    blocks, slots = [], []
+    for s in xrange(count):
+        show = "Show {0}".format(s)
+        for b in xrange(BLOCKS_PER_SHOW):
+            date = tomorrow + datetime.timedelta(days=b)
+            start = datetime.datetime.combine(date.date(), BLOCK_START)
+            end = start + datetime.timedelta(hours=BLOCK_HOURS)
+            blocks.append({'show': show, 'date': date, 'start_time': start,
+                           'end_time': end, 'audition_length': length})
+
+            time = start
+            while time <= end:
+                slots.append((show, time))
+                time += length
+
+    db.session.execute(PossibleAuditionTimes.__table__.insert(), blocks)
+    return slots
+
+def make_bookings(count, slots, users, rng):
+    """
+    Book :count: random slots, for random members (at most one slot
+    each per show, like the signup page allows)
+    """
+    taken = set()
+    rows = []
+    for (show, time) in rng.sample(slots, min(count, len(slots))):
+        user_id = rng.randint(1, users)
+        if (show, user_id) in taken:
+            continue
+        taken.add((show, user_id))
+        rows.append({'show': show, 'time': time, 'time_str': time.strftime("%B %d %H:%M"),
+                     'user_id': user_id})
+
+    if rows:
+        db.session.execute(AuditionTimes.__table__.insert(), rows)
+    return len(rows)
+
+def make_dataset(args):
+    started = time.time()
+    rng = random.Random(args.seed)
+
+    # One hash for everybody: hashing is slow on purpose
+    pwhash = hash_password(PASSWORD)
+
+    db.create_all()
+    make_users(args.users, pwhash)
+    slots = make_shows(args.shows)
+    booked = make_bookings(args.bookings, slots, args.users, rng)
+    db.session.commit()
+
+    return {'users': args.users, 'shows': args.shows, 'slots': len(slots),
+            'bookings': booked, 'seed': args.seed,
+            'seconds': round(time.time() - started, 2)}
+
+#### Running the pages ####
+
+class StatementCounter(object):
+    """
+    Counts the SQL statements run, on every engine
+    """
+    def __init__(self):
+        self.count = 0
+        event.listen(Engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+def log_in(client, email):
+    client.post('/login', data={'email': email, 'password': PASSWORD})
+
+def routes(args):
+    """
+    Return (name, who to log in as, method, path, form data) for each page
+    """
+    show = "Show {0}".format(args.shows // 2)
+    login = {'email': "member0@bench.test", 'password': PASSWORD}
+
+    return [
+        ('index', None, 'GET', '/index', None),
+        ('login', None, 'POST', '/login', login),
+        ('audition_signup', "member1@bench.test", 'GET', '/audition-signup/' + show, None),
+        ('audition_calendar', "admin@bench.test", 'GET', '/audition-calendar/' + show, None),
+        ('adminify', "webmaster@bench.test", 'GET', '/adminify', None),
+    ]
+
+def percentile(values, p):
+    """
+    The :p:th percentile of :values: (nearest rank)
+    """
+    ordered = sorted(values)
+    rank = max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+def run_route(app, counter, route, requests):
+    name, email, method, path, data = route
+
+    client = app.test_client()
+    if email is not None:
+        log_in(client, email)
+
+    times, statements, statuses = [], [], set()
+    for i in xrange(requests):
+        before = counter.count
+        started = time.time()
+        response = client.open(path, method=method, data=data)
+        times.append((time.time() - started) * 1000)
+        statements.append(counter.count - before)
+        statuses.add(response.status_code)
+
+    return {
+        'path': path,
+        'requests': requests,
+        'status': sorted(statuses),
+        'p50_ms': round(percentile(times, 50), 2),
+        'p90_ms': round(percentile(times, 90), 2),
+        'p99_ms': round(percentile(times, 99), 2),
+        'mean_ms': round(sum(times) / len(times), 2),
+        'queries_mean': round(sum(statements) / len(statements), 2),
+        'queries_max': max(statements),
+    }
+
+#### Reporting ####
+
+def report(results):
+    print "{0:<20} {1:>7} {2:>9} {3:>9} {4:>9} {5:>8}".format(
+            "route", "status", "p50 ms", "p90 ms", "p99 ms", "queries")
+    for name, r in sorted(results['routes'].items()):
+        print "{0:<20} {1:>7} {2:>9.1f} {3:>9.1f} {4:>9.1f} {5:>8.1f}".format(
+                name, ",".join(str(s) for s in r['status']),
+                r['p50_ms'], r['p90_ms'], r['p99_ms'], r['queries_mean'])
+
+def compare(old, new, threshold):
+    """
+    Print how each page changed since :old:, and return whether any got worse
+    """
+    print
+    print "Compared with {0}:".format(old.get('timestamp', 'the old run'))
+    if old.get('dataset', {}).get('users') != new['dataset']['users']:
+        print "  (careful, the two runs used different amounts of data)"
+
+    worse = False
+    for name, r in sorted(new['routes'].items()):
+        before = old.get('routes', {}).get(name)
+        if before is None:
+            print "  {0:<20} new".format(name)
+            continue
+
+        change = (r['p50_ms'] - before['p50_ms']) / before['p50_ms'] if before['p50_ms'] else 0
+        slower = change > threshold
+        more_sql = r['queries_mean'] > before['queries_mean']
+        worse = worse or slower or more_sql
+
+        print "  {0:<20} p50 {1:+.0%}  queries {2:.1f} -> {3:.1f}{4}".format(
+                name, change, before['queries_mean'], r['queries_mean'],
+                "  <- worse" if slower or more_sql else "")
+
+    return worse
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the busiest pages against made up data")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--shows', type=int, default=50)
+    parser.add_argument('--bookings', type=int, default=3000)
+    parser.add_argument('--requests', type=int, default=50, help="requests per page")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', default='bench.json', help="where to save the results")
+    parser.add_argument('--compare', help="results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.2,
+            help="how much slower (0.2 = 20%%) a page may get before --compare fails")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench')
+    try:
+        app = create_app()
+        app.config.update(SQLALCHEMY_DATABASE_URI='sqlite:///' + os.path.join(directory, 'bench.db'),
+                          WTF_CSRF_ENABLED=False)
+
+        with app.app_context():
+            dataset = make_dataset(args)
+        print "Made {users} users, {shows} shows, {slots} slots and {bookings} bookings in {seconds}s".format(**dataset)
+
+        counter = StatementCounter()
+        results = {
+            'timestamp': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'dataset': dataset,
+            'routes': dict((route[0], run_route(app, counter, route, args.requests)) for route in routes(args)),
+        }
+    finally:
+        shutil.rmtree(directory)
+
+    report(results)
+
+    with open(args.out, 'w') as out:
+        json.dump(results, out, indent=2, sort_keys=True)
+    print "Saved to {0}".format(args.out)
+
+    if args.compare:
+        with open(args.compare) as old_file:
+            if compare(json.load(old_file), results, args.threshold):
+                raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!flask/bin/python
+"""
+Builds the fingerprinted css/javascript bundles and images (see app/assets.py)
+
+    python build_assets.py
+
+Run this whenever the sass, css, javascript or images change, before
+deploying. It:
+
+* compiles sass/main.scss (into sass/main.css too, so the unbuilt
+  fallback stays in sync) using the `sass` python module (libsass), or
+  the sassc/sass command if that isn't installed,
+* bundles and minifies the files in assets.BUNDLES, using the rcssmin
+  and rjsmin modules if they're installed,
+* names every output after a hash of its contents, writes .gz and .br
+  copies next to it, and records it all in static/dist/manifest.json,
+* makes any missing smaller copies of the slideshow photos (see
+  app/photos.py), if Pillow is installed.
+
+Files from older builds are left alone, because cached pages may still
+link to them.
+"""
+from app import create_app, photos
+from app.assets import BUNDLES, FINGERPRINTED_DIRS, UNFINGERPRINTED_DIRS, dist_dir, manifest_path
+import gzip
+import hashlib
+import json
+import os
+import re
+import subprocess
+
+app = create_app(views=False)
+STATIC = app.static_folder
+
+def compile_sass(name):
+    """
+    Return the css compiled from the sass file static/:name:
+    """
+    path = os.path.join(STATIC, name)
+
+    try:
+        import sass
+        css = sass.compile(filename=path)
+    except ImportError:
+        css = None
+        for command in (['sassc', path], ['sass', path]):
+            try:
+                css = subprocess.check_output(command)
+                break
+            except OSError:
+                continue
+
+    if css is None:
+        # No compiler around, so settle for the last hand-compiled css
+        print "  no sass compiler found, using the existing css for {0}".format(name)
+        with open(os.path.join(STATIC, name[:-len('.scss')] + '.css')) as css_file:
+            return css_file.read()
+
+    with open(os.path.join(STATIC, name[:-len('.scss')] + '.css'), 'w') as css_file:
+        css_file.write(css)
+
+    return css
+
+def read_source(name):
+    """
+    Return the contents of static/:name:, compiling it if it's sass
+    """
+    if name.endswith('.scss'):
+        css = compile_sass(name)
+    else:
+        with open(os.path.join(STATIC, name)) as source_file:
+            css = source_file.read()
+
+    if name.endswith('.css') or name.endswith('.scss'):
+        css = rebase_urls(css, os.path.dirname(name))
+
+    return css
+
+def rebase_urls(css, directory):
+    """
+    Point relative url(...)s in css from static/:directory: at the right
+    place, since the bundle is served from somewhere else
+    """
+    def rebase(match):
+        url = match.group(2)
+        if re.match(r'^(/|[a-z]+:|#)', url):
+            return match.group(0)
+
+        path = os.path.normpath(os.path.join(directory, url)).replace(os.sep, '/')
+        return 'url({0}{1}/{2}{0})'.format(match.group(1), app.static_url_path, path)
+
+    return re.sub(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)', rebase, css)
+
+def minify(bundle, text):
+    try:
+        if bundle.endswith('.css'):
+            import rcssmin
+            return rcssmin.cssmin(text)
+        else:
+            import rjsmin
+            return rjsmin.jsmin(text)
+    except ImportError:
+        return text
+
+def write_fingerprinted(name, content):
+    """
+    Write :content: to dist/ under a name with its hash in it (plus
+    compressed copies), and return that name
+    """
+    root, extension = os.path.splitext(name)
+    hashed = "{0}.{1}{2}".format(root, hashlib.sha1(content).hexdigest()[:12], extension)
+    path = os.path.join(dist_dir(), hashed)
+
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    with open(path, 'wb') as out:
+        out.write(content)
+
+    # Images are already compressed, so only bother with text
+    if extension in ('.css', '.js', '.svg'):
+        with open(path + '.gz', 'wb') as raw:
+            # mtime=0 so rebuilding the same file gives the same .gz
+            with gzip.GzipFile(filename='', mode='wb', fileobj=raw, compresslevel=9, mtime=0) as out:
+                out.write(content)
+
+        try:
+            import brotli
+            with open(path + '.br', 'wb') as out:
+                out.write(brotli.compress(content))
+        except ImportError:
+            pass
+
+    return hashed
+
+def static_files(directory):
+    """
+    Yield the names (relative to static/) of the files under static/:directory:
+    """
+    for root, dirs, files in os.walk(os.path.join(STATIC, directory)):
+        relative_root = os.path.relpath(root, STATIC).replace(os.sep, '/')
+        dirs[:] = [d for d in dirs if relative_root + '/' + d not in UNFINGERPRINTED_DIRS]
+
+        for filename in sorted(files):
+            yield relative_root + '/' + filename
+
+def build():
+    manifest = {}
+
+    for bundle, sources in sorted(BUNDLES.items()):
+        print "Bundling {0}".format(bundle)
+        # The ; is in case a script doesn't end its last statement
+        separator = ";\n" if bundle.endswith('.js') else "\n"
+        text = separator.join(read_source(name) for name in sources)
+        manifest[bundle] = write_fingerprinted(bundle, minify(bundle, text))
+
+    for directory in FINGERPRINTED_DIRS:
+        for name in static_files(directory):
+            with open(os.path.join(STATIC, name), 'rb') as static_file:
+                manifest[name] = write_fingerprinted(name, static_file.read())
+
+    # Write the manifest last (and atomically), so the site only switches
+    # over once every file it points at exists
+    temp_path = manifest_path() + '.tmp'
+    with open(temp_path, 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+    os.rename(temp_path, manifest_path())
+
+    print "Wrote {0} files to {1}".format(len(manifest), dist_dir())
+
+    if photos.pillow() is None:
+        print "Pillow isn't installed, so no slideshow variants were made"
+    else:
+        print "Made {0} slideshow variants".format(photos.make_all_variants())
+
+if __name__ == '__main__':
+    with app.app_context():
+        build()
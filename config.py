@@ -20,6 +20,126 @@ SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(basedir, 'app.db')
 # We don't need sqlalchemy to track our changes for us
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# How many database connections each process keeps open, how many more it
+# may open when they're all busy, and how long (in seconds) to wait for one
+SQLALCHEMY_POOL_SIZE = 5
+SQLALCHEMY_MAX_OVERFLOW = 10
+SQLALCHEMY_POOL_TIMEOUT = 10
+
+# Read only routes read over their own connections (see app/database.py).
+# None means to the same database; set it to point them somewhere else.
+SQLALCHEMY_READ_DATABASE_URI = None
+
+# Settings for every new sqlite connection (other databases ignore these).
+# WAL lets people read while somebody writes, and with WAL, NORMAL
+# synchronous is still crash safe. busy_timeout is how many milliseconds
+# to wait for a lock before giving up. A negative cache_size is in KiB.
+SQLITE_JOURNAL_MODE = 'WAL'
+SQLITE_SYNCHRONOUS = 'NORMAL'
+SQLITE_BUSY_TIMEOUT = 5000
+SQLITE_CACHE_SIZE = -16000
+
+# How passwords get hashed. The method has to include the number of
+# iterations. Changing these is safe: old hashes get upgraded the next
+# time their owner logs in.
+PASSWORD_HASH_METHOD = 'pbkdf2:sha256:50000'
+PASSWORD_SALT_LENGTH = 16
+
+# How many passwords can be hashed at once (per worker process)
+PASSWORD_HASH_WORKERS = 4
+
+# Cache who users are and what they're allowed to do between requests,
+# so checking permissions doesn't need the database.
+# Each worker keeps its own cache. Whenever a user is changed, the
+# USER_CACHE_STAMP file gets rewritten, and every worker empties its cache
+# when it sees that, so e.g. a demoted admin loses their pages everywhere
+# straight away. (If the file can't be written, it takes up to
+# USER_CACHE_TTL seconds instead.)
+USER_CACHE_ENABLED = True
+USER_CACHE_SIZE = 1024
+USER_CACHE_TTL = 60
+USER_CACHE_STAMP = os.path.join(basedir, 'cache', 'users.stamp')
+
+# How long (in seconds) to trust the cached list of shows holding auditions.
+# Blocks made through this process show up straight away regardless.
+OPEN_SHOWS_TTL = 60
+
+# How often (in seconds) to check whether another process has posted new announcements
+ANNOUNCEMENTS_TTL = 30
+
+# Cache-Control for the public pages, by route. Browsers always get an ETag
+# and Last-Modified too, so "no-cache" still means a cheap 304 when nothing changed.
+# Pages shown to a logged in user are always made private.
+HTTP_CACHE_CONTROL_DEFAULT = 'no-cache'
+HTTP_CACHE_CONTROL = {
+    'main.index': 'public, max-age=60',
+    'main.subtroupes': 'public, max-age=300',
+    'main.about': 'public, max-age=3600',
+    'main.tickets': 'public, max-age=3600',
+    'main.join': 'public, max-age=3600',
+    'main.alumni': 'public, max-age=3600',
+}
+
+# Keep the rendered public pages for visitors who aren't logged in.
+# 'memory' keeps up to RESPONSE_CACHE_SIZE pages in each process,
+# 'disk' keeps them in RESPONSE_CACHE_DIR (shared by all processes),
+# None turns this off.
+RESPONSE_CACHE = 'memory'
+RESPONSE_CACHE_SIZE = 64
+RESPONSE_CACHE_DIR = os.path.join(basedir, 'cache', 'pages')
+
+# How long (in seconds) browsers may keep fingerprinted assets (see build_assets.py)
+ASSETS_MAX_AGE = 365 * 24 * 60 * 60
+
+# serve.py, the production server. It forks SERVE_WORKERS processes and
+# gives them SERVE_GRACEFUL_TIMEOUT seconds to finish up when it's stopped.
+SERVE_HOST = '0.0.0.0'
+SERVE_PORT = 8000
+SERVE_WORKERS = 4
+SERVE_GRACEFUL_TIMEOUT = 30
+
+# How long (in ms) create_app() may take, for the website and for scripts
+# (views=False). startup_check.py fails if it takes longer.
+STARTUP_BUDGET_MS = {'web': 750, 'scripts': 600}
+
+# How many members /adminify and /webmasterify show at a time
+MEMBERS_PER_PAGE = 50
+
+# Keep count of how long each page takes and how much SQL it runs, for
+# the webmaster to see at /metrics (see app/metrics.py)
+METRICS_ENABLED = True
+# The request time histogram's buckets, in seconds
+METRICS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+# Log any SQL statement that takes longer than this (in ms). None turns it off.
+SLOW_QUERY_MS = 200
+
+# Profile some of the requests, saving each profile in PROFILE_DIR (see
+# app/profiler.py). Off while PROFILE_RATE is 0. All but the token can be
+# changed while the site is running, with profiles.py.
+PROFILE_DIR = os.path.join(basedir, 'profiles')
+PROFILE_CONTROL = os.path.join(PROFILE_DIR, 'control.json')
+# The fraction of requests to profile, and (if not empty) the endpoints to pick them from
+PROFILE_RATE = 0
+PROFILE_ENDPOINTS = []
+# 'prof' (cProfile) or 'collapsed' (a stack sample every PROFILE_INTERVAL_MS)
+PROFILE_FORMAT = 'prof'
+PROFILE_INTERVAL_MS = 5
+# The most profiles to keep. The oldest are deleted as new ones are saved,
+# and 0 keeps none (every profile is deleted as soon as it's written).
+PROFILE_KEEP = 200
+# Requests with this in an X-Profile header are always profiled. None turns that off.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+
+# Photos uploaded to the homepage slideshow (see app/photos.py)
+ALLOWED_EXTENSIONS = set(['jpg', 'jpeg', 'png', 'gif'])
+# Uploads bigger than this (in bytes) are turned away
+MAX_CONTENT_LENGTH = 16 * 1024 * 1024
+# How much of an upload to copy to disk at a time
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# The widths of the smaller copies made of each photo, and their jpeg quality
+PHOTO_VARIANT_WIDTHS = [480, 960, 1440]
+PHOTO_VARIANT_QUALITY = 80
+
 # Email support!!!
 MAIL_SERVER = 'smtp.googlemail.com'
 MAIL_PORT = 465
@@ -28,3 +148,16 @@ MAIL_USE_SSL = True
 MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
 MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
 MAIL_ADDRESS = os.environ.get('MAIL_ADDRESS')
+MAIL_DEFAULT_SENDER = MAIL_ADDRESS
+
+# Emails are queued in the database and sent in the background (see app/outbox.py)
+# How often (in seconds) to look for queued emails that are due
+MAIL_OUTBOX_POLL = 30
+# The most emails to send over one connection
+MAIL_OUTBOX_BATCH = 100
+# How long (in seconds) to wait before retrying a failed email.
+# This doubles after every failure, until MAIL_MAX_ATTEMPTS have failed.
+MAIL_RETRY_DELAY = 60
+MAIL_MAX_ATTEMPTS = 6
+# How long one process gets to send the emails it picked before others may try
+MAIL_CLAIM_SECONDS = 300
@@ -0,0 +1,178 @@
+#!flask/bin/python
+"""
+Brings an existing database up to date with the audition tables in app/models.py
+
+    python migrate.py          # migrate, then check the query plans
+    python migrate.py --check  # only check the query plans
+
+db.create_all() makes tables that are missing, but never changes ones that
+already exist. So for a database made before the composite indexes, this:
+
+* fills in AuditionTimes.time from time_str for any row missing it, and
+  trims every time to the minute, since that's what slots are looked up by,
+* drops all but the first booking of any slot that got booked twice
+  (otherwise the unique index can't be made),
+* drops the old single column indexes and makes the new composite ones.
+
+It's safe to run as many times as you like.
+
+The check asks sqlite (with EXPLAIN QUERY PLAN) how it would run each of
+the hot audition queries, and fails loudly if one of them wouldn't use the
+index it's meant to.
+"""
+from app import create_app, db
+from app.models import User, AuditionTimes, PossibleAuditionTimes, slot_time
+from sqlalchemy import inspect
+import datetime
+import sys
+
+MIGRATED_TABLES = [AuditionTimes.__table__, PossibleAuditionTimes.__table__]
+
+def backfill_times():
+    """
+    Give every audition a real time, to the minute, and drop double bookings
+
+    Returns (number of times changed, number of double bookings dropped)
+    """
+    table = AuditionTimes.__table__
+    blocks = db.session.query(PossibleAuditionTimes.show, PossibleAuditionTimes.date).all()
+
+    changed = 0
+    dropped = []
+    seen = set()
+
+    rows = db.session.execute(db.select([table.c.id, table.c.show, table.c.time, table.c.time_str])
+            .order_by(table.c.id)).fetchall()
+
+    for (audition_id, show, time, time_str) in rows:
+        new_time = slot_time(time) if time is not None else time_from_str(show, time_str, blocks)
+
+        if (show, new_time) in seen:
+            dropped.append(audition_id)
+            continue
+        seen.add((show, new_time))
+
+        if new_time != time:
+            db.session.execute(table.update().where(table.c.id == audition_id).values(time=new_time))
+            changed += 1
+
+    if dropped:
+        db.session.execute(table.delete().where(table.c.id.in_(dropped)))
+
+    db.session.commit()
+    return changed, len(dropped)
+
+def time_from_str(show, time_str, blocks):
+    """
+    Turn a "%B %d %H:%M" time_str back into a datetime. It has no year, so
+    take the year of the show's audition block on that day (or this year).
+    """
+    time = datetime.datetime.strptime(time_str, "%B %d %H:%M")
+
+    for (block_show, date) in blocks:
+        if block_show == show and (date.month, date.day) == (time.month, time.day):
+            return time.replace(year=date.year)
+
+    return time.replace(year=datetime.date.today().year)
+
+def update_indexes():
+    """
+    Drop the indexes the models no longer have, and make the ones they do
+
+    Returns (names dropped, names made)
+    """
+    inspector = inspect(db.engine)
+    dropped, made = [], []
+
+    for table in MIGRATED_TABLES:
+        wanted = dict((index.name, index) for index in table.indexes)
+        existing = set(index['name'] for index in inspector.get_indexes(table.name))
+
+        for name in sorted(existing - set(wanted)):
+            # sqlite's own indexes (from constraints) can't be dropped
+            if not name.startswith('sqlite_'):
+                db.engine.execute('DROP INDEX "{0}"'.format(name))
+                dropped.append(name)
+
+        for name in sorted(set(wanted) - existing):
+            wanted[name].create(db.engine)
+            made.append(name)
+
+    return dropped, made
+
+#### Query plan checks ####
+
+def hot_queries():
+    """
+    Return (description, index it should use, query) for the audition
+    queries that run on every signup/calendar page, and the member list
+    of /adminify and /webmasterify
+    """
+    now = datetime.datetime.today()
+
+    return [
+        ("taken slots for a show", 'ix_audition_times_show_time',
+            db.session.query(AuditionTimes.time).filter_by(show='show')),
+        ("a user's booking for a show", 'ix_audition_times_show_user_id',
+            db.session.query(AuditionTimes.time).filter_by(show='show', user_id=1)),
+        ("upcoming auditions for the calendar", 'ix_audition_times_show_time',
+            db.session.query(AuditionTimes.id).filter_by(show='show')
+                .filter(AuditionTimes.time > now).order_by(AuditionTimes.time)),
+        ("upcoming audition blocks for a show", 'ix_possible_audition_times_show_date',
+            db.session.query(PossibleAuditionTimes.id).filter_by(show='show')
+                .filter(PossibleAuditionTimes.date > now)
+                .order_by(PossibleAuditionTimes.date, PossibleAuditionTimes.start_time)),
+        ("a page of members", 'ix_user_name',
+            User.directory().limit(50)),
+        ("members whose email starts with a prefix", 'ix_user_email',
+            User.directory('someone@')),
+    ]
+
+def query_plan(query):
+    """
+    Return the lines of sqlite's EXPLAIN QUERY PLAN for :query:
+    """
+    compiled = query.statement.compile(db.engine)
+    params = [compiled.params[name] for name in compiled.positiontup]
+
+    plan = db.engine.execute("EXPLAIN QUERY PLAN " + str(compiled), *params).fetchall()
+
+    # The description is always the last column, however many the sqlite version has
+    return [list(row)[-1] for row in plan]
+
+def check_query_plans():
+    """
+    Print the plan of each hot query, and return whether they all use their index
+    """
+    if db.engine.dialect.name != 'sqlite':
+        print "Query plans are only checked on sqlite"
+        return True
+
+    ok = True
+    for (description, index, query) in hot_queries():
+        plan = query_plan(query)
+        uses_index = any(index in line for line in plan)
+        ok = ok and uses_index
+
+        print "{0} {1}".format("ok  " if uses_index else "FAIL", description)
+        for line in plan:
+            print "       " + line
+
+    return ok
+
+if __name__ == '__main__':
+    app = create_app(views=False)
+
+    with app.app_context():
+        db.create_all()
+
+        if '--check' not in sys.argv:
+            changed, dropped = backfill_times()
+            print "Fixed the time of {0} auditions, dropped {1} double bookings".format(changed, dropped)
+
+            removed, made = update_indexes()
+            print "Dropped indexes: {0}".format(", ".join(removed) or "none")
+            print "Made indexes: {0}".format(", ".join(made) or "none")
+
+        if not check_query_plans():
+            sys.exit(1)
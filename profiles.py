@@ -0,0 +1,179 @@
+#!flask/bin/python
+"""
+Switches request profiling on and off, and sums up the profiles it made
+
+    python profiles.py on [--rate 0.05] [--endpoint main.audition_signup ...]
+                          [--format prof|collapsed] [--interval-ms 5]
+    python profiles.py off
+    python profiles.py status
+    python profiles.py summary [--endpoint E] [--last N] [--top N]
+                               [--sort tottime|cumulative] [--flamegraph out.txt]
+
+`on` and `off` write the control file (PROFILE_CONTROL in config.py) that
+every running worker checks, so there's no need to restart anything. See
+app/profiler.py for what the settings mean.
+
+`summary` adds up the profiles in PROFILE_DIR (or only the newest --last
+of them, or only one endpoint's) and prints the functions that took the
+most time. cProfile's .prof files and the sampled .collapsed files are
+summed up separately. --flamegraph also writes all the sampled stacks
+merged together, ready for flamegraph.pl.
+"""
+from app.profiler import read_control, write_control, profile_files, FORMATS
+from collections import Counter
+import argparse
+import config
+import os
+import pstats
+import re
+
+# <date>-<time>-<microseconds>-<ms>ms-<endpoint>-<pid>.<format>
+PROFILE_NAME = re.compile(r'^\d{8}-\d{6}-\d{6}-(?P<ms>\d+)ms-(?P<endpoint>.+)-(?P<pid>\d+)\.(?P<format>\w+)$')
+
+def describe(path):
+    """
+    Return (ms, endpoint) for a profile, from its file name
+    """
+    match = PROFILE_NAME.match(os.path.basename(path))
+    if match is None:
+        return (0, None)
+    return (int(match.group('ms')), match.group('endpoint'))
+
+#### on/off ####
+
+def turn_on(args):
+    settings = {'rate': args.rate, 'endpoints': args.endpoint or [], 'format': args.format}
+    if args.interval_ms is not None:
+        settings['interval_ms'] = args.interval_ms
+
+    write_control(config.PROFILE_CONTROL, settings)
+    show_status(args)
+
+def turn_off(args):
+    settings = dict(read_control(config.PROFILE_CONTROL))
+    settings['rate'] = 0
+
+    write_control(config.PROFILE_CONTROL, settings)
+    show_status(args)
+
+def show_status(args):
+    control = read_control(config.PROFILE_CONTROL)
+
+    rate = control.get('rate', config.PROFILE_RATE)
+    endpoints = control.get('endpoints', config.PROFILE_ENDPOINTS)
+    kind = control.get('format', config.PROFILE_FORMAT)
+
+    if rate:
+        print "Profiling {0:.1%} of requests to {1}, as {2}".format(
+                rate, ", ".join(endpoints) if endpoints else "every page", kind)
+    else:
+        print "Profiling is off"
+
+    print "{0} profiles in {1}".format(len(profile_files(config.PROFILE_DIR)), config.PROFILE_DIR)
+
+#### summary ####
+
+def summarize_calls(paths, sort, top):
+    """
+    Print the :top: functions of the cProfile dumps at :paths:, added together
+    """
+    stats = pstats.Stats(paths[0])
+    for path in paths[1:]:
+        stats.add(path)
+
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+
+def summarize_samples(paths, top, flamegraph=None):
+    """
+    Print the :top: functions of the sampled stacks at :paths:, added together
+    """
+    stacks = Counter()
+    for path in paths:
+        with open(path) as samples:
+            for line in samples:
+                stack, count = line.rsplit(' ', 1)
+                stacks[stack] += int(count)
+
+    total = sum(stacks.values())
+    if not total:
+        print "No samples (the requests were all quicker than the sampling interval)"
+        return
+
+    # Self: the function was running. Total: it was anywhere on the stack.
+    own, anywhere = Counter(), Counter()
+    for (stack, count) in stacks.items():
+        frames = stack.split(';')
+        own[frames[-1]] += count
+        for frame in set(frames):
+            anywhere[frame] += count
+
+    print "{0} samples".format(total)
+    print
+    print "{0:>7} {1:>7}  {2}".format("self", "total", "function")
+    for (frame, count) in own.most_common(top):
+        print "{0:>7.1%} {1:>7.1%}  {2}".format(count / float(total), anywhere[frame] / float(total), frame)
+
+    if flamegraph:
+        with open(flamegraph, 'w') as out:
+            for (stack, count) in stacks.most_common():
+                out.write("{0} {1}\n".format(stack, count))
+        print
+        print "Merged stacks written to {0}".format(flamegraph)
+
+def summarize(args):
+    paths = profile_files(config.PROFILE_DIR)
+    if args.endpoint:
+        paths = [p for p in paths if describe(p)[1] in args.endpoint]
+    if args.last:
+        paths = paths[-args.last:]
+
+    if not paths:
+        print "No profiles in {0}".format(config.PROFILE_DIR)
+        return
+
+    slowest = sorted(paths, key=lambda p: describe(p)[0], reverse=True)[:5]
+    print "{0} profiles. The slowest:".format(len(paths))
+    for path in slowest:
+        ms, endpoint = describe(path)
+        print "  {0:>6}ms  {1:<28} {2}".format(ms, endpoint, os.path.basename(path))
+
+    calls = [p for p in paths if p.endswith('.prof')]
+    samples = [p for p in paths if p.endswith('.collapsed')]
+
+    if calls:
+        print
+        print "== Calls, from {0} cProfile dumps ==".format(len(calls))
+        summarize_calls(calls, args.sort, args.top)
+
+    if samples:
+        print
+        print "== Time, from {0} sampled profiles ==".format(len(samples))
+        summarize_samples(samples, args.top, args.flamegraph)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Profile requests and sum up the profiles")
+    commands = parser.add_subparsers()
+
+    on = commands.add_parser('on', help="start profiling (in every worker)")
+    on.add_argument('--rate', type=float, default=0.05, help="fraction of requests to profile")
+    on.add_argument('--endpoint', action='append', help="only profile this endpoint (can be repeated)")
+    on.add_argument('--format', choices=FORMATS, default=config.PROFILE_FORMAT)
+    on.add_argument('--interval-ms', type=float, help="how often to sample, for --format collapsed")
+    on.set_defaults(command=turn_on)
+
+    off = commands.add_parser('off', help="stop profiling")
+    off.set_defaults(command=turn_off)
+
+    status = commands.add_parser('status', help="say whether profiling is on")
+    status.set_defaults(command=show_status)
+
+    summary = commands.add_parser('summary', help="sum up the profiles")
+    summary.add_argument('--endpoint', action='append', help="only this endpoint's profiles (can be repeated)")
+    summary.add_argument('--last', type=int, help="only the newest N profiles")
+    summary.add_argument('--top', type=int, default=25, help="how many functions to show")
+    summary.add_argument('--sort', choices=['tottime', 'cumulative', 'calls'], default='tottime')
+    summary.add_argument('--flamegraph', help="write the merged sampled stacks here")
+    summary.set_defaults(command=summarize)
+
+    args = parser.parse_args()
+    args.command(args)
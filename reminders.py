@@ -0,0 +1,24 @@
+#!flask/bin/python
+"""
+Emails everybody with an audition today to remind them about it
+
+Run this once a day, e.g. from cron. Running it again is cheap and safe:
+anybody who has already been reminded is skipped.
+
+    python reminders.py [YYYY-MM-DD]
+"""
+from app import create_app, emailing
+import datetime
+import sys
+
+app = create_app(views=False)
+
+if len(sys.argv) > 1:
+    day = datetime.datetime.strptime(sys.argv[1], "%Y-%m-%d").date()
+else:
+    day = datetime.date.today()
+
+with app.app_context():
+    queued, sent = emailing.send_audition_reminders(day)
+
+print "Queued {0} reminders for {1}, sent {2} emails".format(queued, day, sent)
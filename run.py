@@ -1,16 +1,14 @@
 #!flask/bin/python
 """
-Runs the website
+Runs the website for development (see serve.py for production)
 """
-from app import app, db
-import sys
+from app import create_app, db
 
-# Cheaty, cheaty hack to assume utf8 instead of ascii
-reload(sys)
-sys.setdefaultencoding('utf8')
+app = create_app()
 
 # Create the database if it doesn't exist
-db.create_all()
+with app.app_context():
+    db.create_all()
 
 # Run the actual site
 app.run(debug=True)
@@ -0,0 +1,173 @@
+#!flask/bin/python
+"""
+Runs the website in production
+
+    python serve.py [--host HOST] [--port PORT] [--workers N]
+
+(run.py is still the one to use while developing: it reloads itself and
+shows the debugger.)
+
+The master process loads the app once, makes any missing database tables,
+and warms up the caches by compiling every template and drawing each
+public page. Then it opens the listening socket and forks the workers,
+which all start out with those caches. Each worker serves one request at
+a time off the shared socket.
+
+The master doesn't serve anything itself. It starts a new worker whenever
+one dies. On SIGTERM (or ctrl-c) it tells the workers to stop, and each
+one finishes the request it's on before exiting. Any that are still going
+after SERVE_GRACEFUL_TIMEOUT seconds get killed.
+"""
+from app import create_app, db
+from werkzeug.serving import make_server
+import argparse
+import errno
+import os
+import signal
+import time
+
+app = create_app()
+
+# Drawn before forking, so every worker starts with them cached
+WARM_PAGES = ['/', '/about', '/tickets', '/subtroupes', '/join', '/alumni']
+
+def warm_up():
+    """
+    Fill the template and content caches, then close every database
+    connection so no worker shares one with another
+    """
+    with app.app_context():
+        db.create_all()
+
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    client = app.test_client()
+    for path in WARM_PAGES:
+        status = client.get(path).status_code
+        if status != 200:
+            print "Warming up {0} gave a {1}".format(path, status)
+
+    db.session.remove()
+    db.dispose_engines(app)
+
+#### Workers ####
+
+def run_worker(server):
+    """
+    Serve requests until told to stop. Never returns.
+    """
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Don't let the signal cut off the request being handled
+    signal.siginterrupt(signal.SIGTERM, False)
+
+    # Workers race to accept each connection, and the losers mustn't
+    # block waiting for the next one or they'd never notice a SIGTERM
+    server.socket.setblocking(False)
+    server.timeout = 1
+
+    while not stopping:
+        try:
+            server.handle_request()
+        except Exception:
+            app.logger.exception("Worker failed to handle a request")
+
+    os._exit(0)
+
+def spawn(server):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_worker(server)
+        finally:
+            os._exit(1)
+    return pid
+
+#### The master ####
+
+def serve(host, port, workers):
+    warm_up()
+
+    server = make_server(host, port, app)
+    print "Serving on http://{0}:{1} with {2} workers".format(host, port, workers)
+
+    started = {}
+    for i in range(workers):
+        started[spawn(server)] = time.time()
+
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while not stopping:
+        try:
+            pid, status = os.wait()
+        except OSError as e:
+            if e.errno == errno.EINTR:
+                continue
+            raise
+
+        if pid not in started or stopping:
+            continue
+
+        print "Worker {0} died (status {1}), starting another".format(pid, status)
+
+        # Don't fork as fast as we can if workers die as soon as they start
+        if time.time() - started.pop(pid) < 1:
+            time.sleep(1)
+        started[spawn(server)] = time.time()
+
+    shut_down(started.keys(), app.config.get('SERVE_GRACEFUL_TIMEOUT', 30))
+    server.server_close()
+
+def shut_down(pids, timeout):
+    """
+    Ask the workers to finish up and wait for them, killing any that take
+    longer than :timeout: seconds
+    """
+    print "Shutting down {0} workers".format(len(pids))
+
+    for pid in pids:
+        signal_worker(pid, signal.SIGTERM)
+
+    deadline = time.time() + timeout
+    remaining = set(pids)
+    while remaining and time.time() < deadline:
+        for pid in list(remaining):
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                remaining.discard(pid)
+        time.sleep(0.1)
+
+    for pid in remaining:
+        print "Worker {0} didn't stop in time, killing it".format(pid)
+        signal_worker(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+def signal_worker(pid, signum):
+    try:
+        os.kill(pid, signum)
+    except OSError as e:
+        # It's already gone
+        if e.errno != errno.ESRCH:
+            raise
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the website with several worker processes")
+    parser.add_argument('--host', default=app.config.get('SERVE_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=app.config.get('SERVE_PORT', 8000))
+    parser.add_argument('--workers', type=int, default=app.config.get('SERVE_WORKERS', 4))
+    args = parser.parse_args()
+
+    serve(args.host, args.port, args.workers)
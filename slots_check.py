@@ -0,0 +1,87 @@
+#!flask/bin/python
+"""
+Checks that a booked audition slot stops being offered
+
+    python slots_check.py
+
+Bookings are stored on the audition block's date, at the slot's time of
+day (that's what the signup form sends back), but a block's start_time
+can be on a different day than its date. So this makes a throwaway
+database with a block of each kind, books the first free slot of each
+the same way the signup page does, and fails if:
+
+* the booked slot is still offered, or
+* somebody else can book it as well.
+
+The database lives in a temporary folder and is thrown away afterwards,
+so nothing here touches app.db.
+"""
+from __future__ import print_function
+from app import create_app, db
+from app.models import User, PossibleAuditionTimes, AuditionTimes, SlotTaken
+from app.auditions import available_auditions, upcoming_blocks
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+
+def make_blocks():
+    """
+    Add one block whose start_time is on its date, and one whose isn't,
+    and return the names of their shows
+    """
+    day = datetime.datetime.combine(datetime.date.today(), datetime.time()) + datetime.timedelta(days=2)
+    length = datetime.timedelta(minutes=15)
+
+    same_day = day.replace(hour=18)
+    other_day = same_day - datetime.timedelta(days=1)
+
+    PossibleAuditionTimes.bulk_create([
+        ("start_time on the date", day, same_day, same_day + datetime.timedelta(hours=1), length),
+        ("start_time on another day", day, other_day, other_day + datetime.timedelta(hours=1), length),
+    ])
+
+    return ["start_time on the date", "start_time on another day"]
+
+def check(show, first, second):
+    blocks = upcoming_blocks(show)
+    day, time = available_auditions(show, blocks)[0]
+
+    # The same as audition_signup does with the label it gets back
+    slot = datetime.datetime.strptime("{0} {1}".format(day, time), "%A %B %d %Y %H:%M")
+    AuditionTimes.reserve(show, slot, first)
+
+    problems = []
+    if (day, time) in available_auditions(show, blocks):
+        problems.append("{0} @ {1} is still offered after being booked".format(day, time))
+
+    try:
+        AuditionTimes.reserve(show, slot, second)
+        problems.append("{0} @ {1} was booked twice".format(day, time))
+    except SlotTaken:
+        pass
+
+    print("{0} {1}".format("FAIL" if problems else "ok  ", show))
+    for problem in problems:
+        print("     " + problem)
+
+    return not problems
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp(prefix='slots')
+    try:
+        app = create_app(views=False)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(directory, 'slots.db')
+
+        with app.app_context():
+            db.create_all()
+            first = User.create("first", "first@slots.test", "x")
+            second = User.create("second", "second@slots.test", "x")
+
+            results = [check(show, first, second) for show in make_blocks()]
+    finally:
+        shutil.rmtree(directory)
+
+    if not all(results):
+        sys.exit(1)
@@ -0,0 +1,72 @@
+#!flask/bin/python
+"""
+Checks that the app still starts up quickly
+
+    python startup_check.py
+
+Every worker serve.py forks, and every run of a script like reminders.py,
+pays for importing the app. This times create_app() in a fresh python
+process, for the website and for scripts (views=False), and fails if
+either is over its budget in STARTUP_BUDGET_MS (config.py). Timings are
+noisy, so each is the best of a few runs.
+
+It also fails if the libraries that are meant to be imported only when
+they're needed (see app/__init__.py) get imported up front anyway, since
+that's usually how the budget gets blown in the first place.
+"""
+from __future__ import print_function
+import config
+import json
+import subprocess
+import sys
+
+RUNS = 5
+
+# Modules that mustn't be loaded just by starting up
+LAZY = {
+    'web': ['bs4', 'PIL', 'flask_mail'],
+    'scripts': ['bs4', 'PIL', 'flask_mail', 'flask_wtf', 'wtforms', 'app.views', 'app.forms'],
+}
+
+# Run in a fresh interpreter, so nothing is imported already
+MEASURE = """
+import json, sys, time
+start = time.time()
+from app import create_app
+create_app(views={views})
+print(json.dumps({{'ms': (time.time() - start) * 1000, 'modules': list(sys.modules)}}))
+"""
+
+def measure(kind):
+    """
+    Return (best time in ms, modules loaded) for starting up as :kind:
+    """
+    code = MEASURE.format(views=(kind == 'web'))
+
+    best, modules = None, []
+    for i in range(RUNS):
+        output = subprocess.check_output([sys.executable, '-c', code])
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        if best is None or result['ms'] < best:
+            best, modules = result['ms'], result['modules']
+
+    return best, modules
+
+def check(kind):
+    budget = config.STARTUP_BUDGET_MS[kind]
+    ms, modules = measure(kind)
+
+    loaded = [name for name in LAZY[kind]
+              if any(m == name or m.startswith(name + '.') for m in modules)]
+
+    ok = ms <= budget and not loaded
+    print("{0} {1}: {2:.0f}ms (budget {3}ms)".format("ok  " if ok else "FAIL", kind, ms, budget))
+    for name in loaded:
+        print("     {0} was imported on startup".format(name))
+
+    return ok
+
+if __name__ == '__main__':
+    results = [check(kind) for kind in ('scripts', 'web')]
+    if not all(results):
+        sys.exit(1)
@@ -0,0 +1,15 @@
+"""
+The app, for WSGI servers to import (e.g. PythonAnywhere's WSGI file)
+
+    from wsgi import application
+
+app/ only has create_app() now, so the old `from app import app` doesn't
+work anymore. This builds the app once, when the server imports it, and
+makes any missing database tables like run.py and serve.py do.
+"""
+from app import create_app, db
+
+app = application = create_app()
+
+with app.app_context():
+    db.create_all()